@@ -0,0 +1,33 @@
+import argparse
+import time
+
+from rag.embedder import embedders
+
+# Run from backend/: PYTHONPATH=src python benchmarks/embedder.py --embedder hash
+
+
+def texts(n: int) -> list[str]:
+    return [
+        f"Chunk {i}: the LHC accelerates proton beams around a 27 km ring "
+        f"of superconducting magnets, run {i % 7}, sector {i % 8}."
+        for i in range(n)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding throughput by batch size")
+    parser.add_argument("--embedder", default="hash", choices=sorted(embedders))
+    parser.add_argument("-n", type=int, default=1024)
+    args = parser.parse_args()
+
+    embedder = embedders[args.embedder]()
+    corpus = texts(args.n)
+    embedder.embed(corpus[:8])
+
+    print(f"{embedder.name}, {args.n} texts")
+    for batch_size in (1, 32, 256):
+        start = time.perf_counter()
+        for i in range(0, len(corpus), batch_size):
+            embedder.embed(corpus[i : i + batch_size])
+        seconds = time.perf_counter() - start
+        print(f"batch {batch_size:>4}: {seconds:7.3f}s {args.n / seconds:9.1f} texts/s")
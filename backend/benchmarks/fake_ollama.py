@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Stand-in for Ollama's /api/generate, no model or GPU needed.
+# Run from backend/: python benchmarks/fake_ollama.py --port 11434
+#
+# Like Ollama it keeps the tokens of recent requests in a few slots and only
+# prefills what follows the longest shared prefix, and it returns the
+# conversation tokens as "context" so a client can continue from them.
+
+
+def tokenize(text: str) -> list[int]:
+    # Word ids in a 256k vocabulary, like real token ids they fit in 32 bits
+    return [
+        int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "big")
+        % 256_000
+        for word in text.split()
+    ]
+
+
+def shared_prefix(a: list[int], b: list[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def create_app(
+    token_rate: float = 50.0,
+    prefill_rate: float = 2000.0,
+    answer_tokens: int = 32,
+    slots: int = 1,
+) -> FastAPI:
+    app = FastAPI()
+    app.state.slots = [[] for _ in range(slots)]
+    app.state.requests = []
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "fake"}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        payload = await request.json()
+        tokens = list(payload.get("context") or []) + tokenize(payload["prompt"])
+
+        slots = app.state.slots
+        slot = max(range(len(slots)), key=lambda i: shared_prefix(slots[i], tokens))
+        reused = shared_prefix(slots[slot], tokens)
+        prompt_eval_count = len(tokens) - reused
+        options = payload.get("options") or {}
+        n_answer = options.get("num_predict") or answer_tokens
+        app.state.requests.append(
+            {"prompt_tokens": len(tokens), "prompt_eval_count": prompt_eval_count}
+        )
+
+        async def stream():
+            start = time.perf_counter()
+            await asyncio.sleep(prompt_eval_count / prefill_rate)
+            answer = []
+            for i in range(n_answer):
+                await asyncio.sleep(1 / token_rate)
+                word = f"token{i}"
+                answer.append(word)
+                message = {"model": payload["model"], "response": f"{word} "}
+                yield json.dumps({**message, "done": False}) + "\n"
+            context = tokens + tokenize(" ".join(answer))
+            slots[slot] = context
+            final = {
+                "model": payload["model"],
+                "response": "",
+                "done": True,
+                "context": context,
+                "prompt_eval_count": prompt_eval_count,
+                "eval_count": n_answer,
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+            }
+            yield json.dumps(final) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens/s")
+    parser.add_argument("--prefill-rate", type=float, default=2000.0, help="tokens/s")
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument("--slots", type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app(args.token_rate, args.prefill_rate, args.answer_tokens, args.slots)
+    uvicorn.run(app, port=args.port, log_level="warning")
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import hashlib
+import time
+import uuid
+
+import grpc
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+from grpc_health.v1._async import HealthServicer
+from weaviate.proto.v1 import (
+    properties_pb2,
+    search_get_pb2,
+    weaviate_pb2_grpc,
+)
+
+# Stand-in for Weaviate and its text2vec-transformers container, no Docker
+# needed. Run from backend/: python benchmarks/fake_weaviate.py
+#
+# The real client talks to it: REST for the version and readiness checks,
+# gRPC for near_vector searches, which return canned passages after a
+# configurable delay. /vectors answers like the inference container.
+
+VERSION = "1.25.0"
+
+TOPICS = [
+    "The Large Hadron Collider is the world's largest particle accelerator.",
+    "It consists of a 27-kilometre ring of superconducting magnets.",
+    "Beams of protons travel close to the speed of light before they collide.",
+    "The magnets are cooled to 1.9 kelvin with superfluid helium.",
+    "ATLAS and CMS are general-purpose detectors on the ring.",
+    "The Higgs boson was discovered by ATLAS and CMS in 2012.",
+    "ALICE studies the quark-gluon plasma produced in heavy-ion collisions.",
+    "LHCb looks at the differences between matter and antimatter.",
+]
+
+
+def make_passages(count: int = 64) -> list[str]:
+    # Neighbouring passages share sentences, like by-title chunks do
+    return [
+        f"Passage {i}. {TOPICS[i % len(TOPICS)]} {TOPICS[(i + 1) % len(TOPICS)]} "
+        f"Run {i // len(TOPICS) + 1} of the brochure goes on about it at length."
+        for i in range(count)
+    ]
+
+
+def hash_vector(text: str, dim: int = 384) -> list[float]:
+    seed = int.from_bytes(hashlib.blake2b(text.encode()).digest()[:8], "big")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class SearchServicer(weaviate_pb2_grpc.WeaviateServicer):
+    def __init__(self, passages: list[str], latency: float):
+        self.passages = passages
+        self.latency = latency
+        self.searches = 0
+
+    async def Search(self, request, context):
+        start = time.perf_counter()
+        self.searches += 1
+        await asyncio.sleep(self.latency)
+
+        # The same vector always gets the same neighbours
+        digest = hashlib.blake2b(request.near_vector.vector_bytes).digest()
+        first = int.from_bytes(digest[:4], "big") % len(self.passages)
+        results = []
+        for rank in range(min(request.limit or 10, len(self.passages))):
+            text = self.passages[(first + rank) % len(self.passages)]
+            properties = properties_pb2.Properties(
+                fields={"text": properties_pb2.Value(text_value=text)}
+            )
+            results.append(
+                search_get_pb2.SearchResult(
+                    properties=search_get_pb2.PropertiesResult(
+                        non_ref_props=properties, target_collection=request.collection
+                    ),
+                    metadata=search_get_pb2.MetadataResult(
+                        id_as_bytes=uuid.uuid5(uuid.NAMESPACE_URL, text).bytes,
+                        distance=0.1 + 0.05 * rank,
+                        distance_present=True,
+                    ),
+                )
+            )
+        return search_get_pb2.SearchReply(
+            took=time.perf_counter() - start, results=results
+        )
+
+
+def create_app(dim: int = 384) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/v1/meta")
+    async def meta():
+        return {"hostname": "http://[::]:8080", "modules": {}, "version": VERSION}
+
+    @app.get("/v1/.well-known/ready")
+    @app.get("/v1/.well-known/live")
+    async def ready():
+        return {}
+
+    @app.get("/v1/.well-known/openid-configuration")
+    async def openid():
+        return JSONResponse({}, status_code=404)
+
+    @app.post("/vectors")
+    async def vectors(request: Request):
+        payload = await request.json()
+        return {"text": payload["text"], "vector": hash_vector(payload["text"], dim)}
+
+    return app
+
+
+async def serve(
+    port: int = 8080,
+    grpc_port: int = 50051,
+    latency: float = 0.01,
+    passages: int = 64,
+    dim: int = 384,
+) -> None:
+    server = grpc.aio.server()
+    weaviate_pb2_grpc.add_WeaviateServicer_to_server(
+        SearchServicer(make_passages(passages), latency), server
+    )
+    health = HealthServicer()
+    await health.set("", health_pb2.HealthCheckResponse.SERVING)
+    health_pb2_grpc.add_HealthServicer_to_server(health, server)
+    server.add_insecure_port(f"127.0.0.1:{grpc_port}")
+    await server.start()
+
+    rest = uvicorn.Server(
+        uvicorn.Config(create_app(dim), port=port, log_level="warning")
+    )
+    try:
+        await rest.serve()
+    finally:
+        await server.stop(None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Weaviate server")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--grpc-port", type=int, default=50051)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds/search")
+    parser.add_argument("--passages", type=int, default=64)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.port, args.grpc_port, args.latency, args.passages))
@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+import numpy as np
+import uvicorn
+import yaml
+
+import fake_ollama
+import fake_weaviate
+
+# Run from backend/: PYTHONPATH=src python benchmarks/loadtest.py
+# End-to-end load test of the serving path without GPU, Docker or network.
+# Fake Ollama and fake Weaviate run in one process, api.app:app in another
+# configured against them, and concurrent users stream /chat/question.
+#
+# Save a run with --output and check the next release against it with
+# --baseline, the exit code is 1 when a metric is worse than the tolerance.
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_fakes(ports: dict[str, int], options: dict) -> None:
+    ollama = fake_ollama.create_app(
+        token_rate=options["token_rate"],
+        prefill_rate=options["prefill_rate"],
+        answer_tokens=options["answer_tokens"],
+        slots=options["slots"],
+    )
+    server = uvicorn.Server(
+        uvicorn.Config(ollama, port=ports["ollama"], log_level="warning")
+    )
+
+    async def serve():
+        await asyncio.gather(
+            server.serve(),
+            fake_weaviate.serve(
+                ports["weaviate"],
+                ports["grpc"],
+                latency=options["retrieval_latency"],
+                passages=options["passages"],
+            ),
+        )
+
+    asyncio.run(serve())
+
+
+def run_app(port: int, overrides: dict, verbose: bool) -> None:
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    # Before anything else is imported, dataclass defaults read CONFIG once
+    from config.conf import CONFIG
+
+    for key, value in overrides.items():
+        setattr(CONFIG, key, value)
+
+    from api.app import app
+
+    uvicorn.run(app, port=port, log_level="warning")
+
+
+def memory(pid: int) -> dict[str, float] | None:
+    # Resident and peak resident set size of the server, in MB
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            status = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    return {
+        "rss": int(status["VmRSS"].split()[0]) / 1024,
+        "peak": int(status["VmHWM"].split()[0]) / 1024,
+    }
+
+
+@dataclass
+class Result:
+    status: int
+    ttft: float | None = None
+    latency: float | None = None
+    chunks: int = 0
+
+
+async def ask(
+    client: httpx.AsyncClient, question: str, session_id: str | None
+) -> tuple[Result, str | None]:
+    body = {"question": question}
+    if session_id is not None:
+        body["session_id"] = session_id
+    else:
+        body["start_session"] = True
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", "/chat/question", json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return Result(response.status_code), session_id
+            result = Result(200)
+            async for chunk in response.aiter_text():
+                if not chunk:
+                    continue
+                if result.ttft is None:
+                    result.ttft = time.perf_counter() - start
+                result.chunks += 1
+            result.latency = time.perf_counter() - start
+            return result, response.headers.get("X-Session-Id", session_id)
+    except httpx.HTTPError:
+        return Result(0), session_id
+
+
+async def user(
+    client: httpx.AsyncClient,
+    conversations: itertools.count,
+    total: int,
+    turns: int,
+    distinct: int,
+    results: list[Result],
+) -> None:
+    # Conversations are handed out until all have started
+    for conversation in conversations:
+        if conversation >= total:
+            return
+        session_id = None
+        for turn in range(turns):
+            topic = conversation % distinct
+            question = f"Question {topic}.{turn}: what does the LHC do?"
+            result, session_id = await ask(client, question, session_id)
+            results.append(result)
+
+
+async def wait_ready(
+    client: httpx.AsyncClient, server: multiprocessing.Process, timeout: float
+) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not server.is_alive():
+            # Startup failed, its traceback is already on stderr
+            raise RuntimeError(f"Server exited with code {server.exitcode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(max(values)),
+    }
+
+
+def summarize(results: list[Result], seconds: float, memory: dict) -> dict:
+    ok = [result for result in results if result.status == 200]
+    streaming = [
+        (result.chunks - 1) / (result.latency - result.ttft)
+        for result in ok
+        if result.chunks > 1 and result.latency > result.ttft
+    ]
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected": sum(result.status == 429 for result in results),
+        "failed": sum(result.status not in (200, 429) for result in results),
+        "seconds": seconds,
+        "rps": len(ok) / seconds if seconds else 0.0,
+        "ttft": percentiles([result.ttft for result in ok if result.ttft]),
+        "latency": percentiles([result.latency for result in ok]),
+        "chunks_per_second": percentiles(streaming),
+        "memory": memory,
+    }
+
+
+def report(summary: dict) -> str:
+    lines = [
+        f"{summary['ok']}/{summary['requests']} requests in "
+        f"{summary['seconds']:.1f}s, {summary['rps']:.2f} req/s "
+        f"({summary['rejected']} rejected, {summary['failed']} failed)",
+        f"{'':<18} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}",
+    ]
+    for name, label in (
+        ("ttft", "ttft (s)"),
+        ("latency", "latency (s)"),
+        ("chunks_per_second", "chunks/s"),
+    ):
+        stats = summary[name]
+        if stats:
+            lines.append(
+                f"{label:<18} {stats['p50']:>8.3f} {stats['p95']:>8.3f} "
+                f"{stats['p99']:>8.3f} {stats['max']:>8.3f}"
+            )
+    memory = summary["memory"]
+    if memory:
+        lines.append(
+            f"server rss: {memory['ready']:.1f} MB ready, "
+            f"{memory['end']:.1f} MB after, {memory['peak']:.1f} MB peak"
+        )
+    return "\n".join(lines)
+
+
+# metric -> True when higher is better
+CHECKS = {
+    ("rps",): True,
+    ("ttft", "p95"): False,
+    ("latency", "p95"): False,
+    ("memory", "peak"): False,
+}
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for path, higher_is_better in CHECKS.items():
+        try:
+            current, previous = summary, baseline
+            for key in path:
+                current, previous = current[key], previous[key]
+        except (KeyError, TypeError):
+            continue
+        if not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            name = ".".join(path)
+            regressions.append(
+                f"{name}: {previous:.3f} -> {current:.3f} ({change:+.0%})"
+            )
+    return regressions
+
+
+async def drive(args, port: int, server: multiprocessing.Process) -> dict:
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.users)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", timeout=timeout, limits=limits
+    ) as client:
+        await wait_ready(client, server, args.ready_timeout)
+        ready = memory(server.pid)
+
+        results: list[Result] = []
+        conversations = itertools.count()
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                user(
+                    client,
+                    conversations,
+                    args.conversations,
+                    args.turns,
+                    args.distinct,
+                    results,
+                )
+                for _ in range(args.users)
+            ]
+        )
+        seconds = time.perf_counter() - start
+
+    end = memory(server.pid)
+    usage = None
+    if ready is not None and end is not None:
+        usage = {"ready": ready["rss"], "end": end["rss"], "peak": end["peak"]}
+    return summarize(results, seconds, usage)
+
+
+def parse_overrides(values: list[str]) -> dict:
+    from config.conf import Config
+
+    overrides = {}
+    for value in values:
+        key, _, raw = value.partition("=")
+        if key not in Config.model_fields:
+            raise SystemExit(f"Unknown config key: {key}")
+        overrides[key] = yaml.safe_load(raw)
+    return overrides
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the chat backend")
+    parser.add_argument("--users", type=int, default=8, help="concurrent users")
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=3, help="questions per session")
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=1_000_000,
+        help="distinct conversations, lower it to exercise the caches",
+    )
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens/s")
+    parser.add_argument("--prefill-rate", type=float, default=2000.0, help="tokens/s")
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument("--slots", type=int, default=4, help="Ollama cache slots")
+    parser.add_argument("--retrieval-latency", type=float, default=0.01)
+    parser.add_argument("--passages", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="config override for the server, e.g. admission_max_in_flight=4",
+    )
+    parser.add_argument("--output", type=Path, help="write the summary as JSON")
+    parser.add_argument("--baseline", type=Path, help="summary of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="show server output")
+    args = parser.parse_args()
+
+    ports = {"ollama": free_port(), "weaviate": free_port(), "grpc": free_port()}
+    port = free_port()
+    overrides = {
+        "ollama_url": f"http://127.0.0.1:{ports['ollama']}",
+        "weaviate_host": "127.0.0.1",
+        "weaviate_port": ports["weaviate"],
+        "weaviate_grpc_port": ports["grpc"],
+        "inference_url": f"http://127.0.0.1:{ports['weaviate']}",
+        "embedder": "inference",
+        "retrieval_backend": "weaviate",
+        # Approximate token counts, nothing to download
+        "chat_tokenizer": "",
+        "embedding_cache_path": "",
+        "session_store": "memory",
+        "warmup_retry_interval": 0.5,
+        **parse_overrides(args.set),
+    }
+    options = {
+        "token_rate": args.token_rate,
+        "prefill_rate": args.prefill_rate,
+        "answer_tokens": args.answer_tokens,
+        "slots": args.slots,
+        "retrieval_latency": args.retrieval_latency,
+        "passages": args.passages,
+    }
+
+    context = multiprocessing.get_context("spawn")
+    fakes = context.Process(target=run_fakes, args=(ports, options), daemon=True)
+    server = context.Process(
+        target=run_app, args=(port, overrides, args.verbose), daemon=True
+    )
+    fakes.start()
+    server.start()
+    try:
+        summary = asyncio.run(drive(args, port, server))
+    finally:
+        for process in (server, fakes):
+            process.terminate()
+            process.join(10)
+            if process.is_alive():
+                process.kill()
+
+    summary["settings"] = {
+        **{key: value for key, value in vars(args).items() if key in options},
+        "users": args.users,
+        "conversations": args.conversations,
+        "turns": args.turns,
+        "distinct": args.distinct,
+        "overrides": parse_overrides(args.set),
+    }
+    print(report(summary))
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(summary, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression {regression}")
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from rag.embedding import (
+    batch_maximal_marginal_relevance,
+    cosine_similarity,
+    maximal_marginal_relevance,
+)
+
+# Run from backend/: PYTHONPATH=src python benchmarks/mmr.py
+
+
+def pairwise_mmr(results, k, lambda_param=0.5):
+    # Previous implementation, kept as the reference for parity and timings
+    results = list(results)
+    selected = []
+    while results and len(selected) < k:
+        if not selected:
+            selected.append(results.pop(0))
+        else:
+            similarities = [
+                [
+                    cosine_similarity(obj1.vector["default"], obj2.vector["default"])
+                    for obj2 in results
+                ]
+                for obj1 in selected
+            ]
+            max_similarities = np.max(similarities, axis=0)
+            mmr_scores = [
+                (1 - lambda_param) * (-obj.metadata.distance)
+                - lambda_param * max_similarity
+                for (obj, max_similarity) in zip(results, max_similarities)
+            ]
+            selected.append(results.pop(np.argmax(mmr_scores)))
+
+    return selected
+
+
+def make_results(rng, n, dim=384):
+    vectors = rng.normal(size=(n, dim))
+    distances = np.sort(rng.uniform(0.1, 0.9, size=n))
+    return [
+        SimpleNamespace(
+            uuid=i,
+            vector={"default": vectors[i].tolist()},
+            metadata=SimpleNamespace(distance=float(distances[i])),
+        )
+        for i in range(n)
+    ]
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'n':>5} {'k':>4} {'pairwise':>12} {'numpy':>12} {'speedup':>9}")
+    for n in (50, 100, 200):
+        k = n // 5
+        results = make_results(rng, n)
+
+        expected = [obj.uuid for obj in pairwise_mmr(results, k)]
+        actual = [obj.uuid for obj in maximal_marginal_relevance(results, k)]
+        assert expected == actual, f"selection mismatch for n={n}"
+
+        repeat = 1 if n >= 100 else 3
+        old = timeit(lambda: pairwise_mmr(results, k), repeat)
+        new = timeit(lambda: maximal_marginal_relevance(results, k), repeat)
+        print(f"{n:>5} {k:>4} {old * 1e3:>10.2f}ms {new * 1e3:>10.2f}ms {old / new:>8.1f}x")
+
+    batch = [make_results(rng, 200) for _ in range(16)]
+    batch[3] = batch[3][:40]
+    expected = [[obj.uuid for obj in maximal_marginal_relevance(r, 40)] for r in batch]
+    actual = [
+        [obj.uuid for obj in selected]
+        for selected in batch_maximal_marginal_relevance(batch, 40)
+    ]
+    assert expected == actual, "batch selection mismatch"
+    single = timeit(lambda: [maximal_marginal_relevance(r, 40) for r in batch], 3)
+    batched = timeit(lambda: batch_maximal_marginal_relevance(batch, 40), 3)
+    print(f"batch of {len(batch)} queries: {single * 1e3:.2f}ms looped, {batched * 1e3:.2f}ms batched")
@@ -0,0 +1,59 @@
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+
+from fake_ollama import create_app
+from rag.session import ConversationSession, OllamaSessionGenerator
+
+# Run from backend/: PYTHONPATH=src python benchmarks/session_reuse.py
+# Compares prefill per turn when every turn resends the whole prompt and when
+# the conversation continues from Ollama's context tokens.
+
+CONTEXT = " ".join(f"Retrieved passage {i} about the accelerator." for i in range(10))
+QUESTIONS = [f"Follow-up question number {i} about the LHC?" for i in range(8)]
+
+
+def serve(app) -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+async def conversation(generator: OllamaSessionGenerator, reuse: bool) -> list[int]:
+    session = ConversationSession("benchmark")
+    prompt_tokens = []
+    for question in QUESTIONS:
+        if not reuse:
+            # What a stateless server does: full prompt with the history
+            session.context = None
+        stream = generator.agenerate(session, question, CONTEXT)
+        answer = "".join([chunk async for chunk in stream])
+        session.add_turn(question, answer)
+        prompt_tokens.append(session.prompt_tokens)
+    return prompt_tokens
+
+
+async def main():
+    for reuse in (False, True):
+        app = create_app(token_rate=500, prefill_rate=5000, answer_tokens=64)
+        port = serve(app)
+        generator = OllamaSessionGenerator(url=f"http://127.0.0.1:{port}")
+        start = time.perf_counter()
+        prompt_tokens = await conversation(generator, reuse)
+        seconds = time.perf_counter() - start
+        await generator.aclose()
+        label = "context reuse" if reuse else "full prompt  "
+        print(f"{label}: prefilled {sum(prompt_tokens):>6} tokens in {seconds:.2f}s")
+        print(f"  per turn: {prompt_tokens}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,87 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.routers import chat
+from fastapi.responses import PlainTextResponse
+from api.routers import chat, health
+from api.services.admission import get_admission_controller
+from api.services.cache import get_semantic_cache
+from api.services.chatbot import DEFAULT_COLLECTION, get_chatbot
+from api.services.readiness import get_readiness, warm_up
+from rag.client import get_async_client_pool, get_client_pool
+from rag.embedder import get_embedder
+from rag.session import get_session_generator, get_session_store
+from rag.tokens import get_tokenizer
+from config.conf import CONFIG
+from utils.metrics import REGISTRY, gauge
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client_pool = get_client_pool()
+    async_client_pool = get_async_client_pool()
+    if CONFIG.retrieval_backend == "weaviate":
+        client_pool.open()
+        await async_client_pool.open()
+
+    # A query embedder that does not match the collections stops startup
+    get_embedder()
+    # /ready stays 503 until the first request would not pay for cold starts
+    get_chatbot(DEFAULT_COLLECTION)
+    warm_up_task = None
+    if CONFIG.warmup_enabled:
+        warm_up_task = asyncio.create_task(warm_up(DEFAULT_COLLECTION))
+    else:
+        await asyncio.to_thread(get_tokenizer)
+        get_readiness().ready = True
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await async_client_pool.close()
+    client_pool.close()
+    await get_session_generator().aclose()
+    get_session_store().close()
+    get_embedder().save()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+
+# Uvicorn only configures its own loggers, traces need a handler
+trace_logger = logging.getLogger("chat.trace")
+if not trace_logger.handlers:
+    trace_logger.addHandler(logging.StreamHandler())
+    trace_logger.setLevel(logging.INFO)
+
+gauge(
+    "chat_in_flight",
+    "Generations holding a slot",
+    lambda: get_admission_controller().in_flight,
+)
+gauge(
+    "chat_queue_depth",
+    "Requests waiting for a slot",
+    lambda: get_admission_controller().depth,
+)
+gauge(
+    "semantic_cache_hits",
+    "Answers served from the cache",
+    lambda: get_semantic_cache().hits,
+)
+gauge(
+    "semantic_cache_misses",
+    "Questions the cache could not answer",
+    lambda: get_semantic_cache().misses,
+)
+gauge(
+    "embedding_cache_hits",
+    "Query vectors served from the cache",
+    lambda: get_embedder().hits,
+)
+gauge(
+    "embedding_cache_misses", "Query vectors computed", lambda: get_embedder().misses
+)
 
 origins = ["http://localhost:3000", "localhost:3000"]
 
@@ -13,6 +92,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 app.router.include_router(chat.router, prefix="/chat")
+app.router.include_router(health.router)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
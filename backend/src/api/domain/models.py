@@ -7,4 +7,8 @@ class Question(BaseModel):
 
 class QuestionRequest(BaseModel):
     question: str
-    history: list
+    session_id: str | None = None
+    # Without either, the answer is stateless and history is used as sent
+    start_session: bool = False
+    # Only read to start a session, the server keeps the conversation
+    history: list = []
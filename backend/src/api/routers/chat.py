@@ -1,17 +1,97 @@
-from fastapi import APIRouter, HTTPException, Request
+import time
+from uuid import uuid4
 
-from api.services.chatbot import get_chatbot
+from fastapi import APIRouter, Header, HTTPException, Request
+
+from api.services.admission import (
+    AdmissionRejected,
+    Ticket,
+    get_admission_controller,
+)
+from api.services.chatbot import DEFAULT_COLLECTION, get_chatbot, instrument_stream
+from api.services.coalesce import Seat
 from fastapi.responses import JSONResponse, StreamingResponse
 from api.domain.models import Question, QuestionRequest
+from config.conf import CONFIG
+from utils.metrics import histogram, span, start_trace
 
 
 router = APIRouter()
 
+ADMISSION_WAIT_SECONDS = histogram(
+    "chat_admission_wait_seconds", "Time spent queued for a generation slot"
+)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    # Frees the generation slot or the seat on a coalesced generation
+    # however the response ends, even when the client disconnects before
+    # the body starts streaming
+    def __init__(
+        self, content, ticket: Ticket | None, seat: Seat | None = None, **kwargs
+    ):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+        self.seat = seat
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # A coalesced generation frees its slot when it ends instead
+            if self.ticket is not None and not self.ticket.detached:
+                self.ticket.release()
+            if self.seat is not None:
+                self.seat.release()
+
 
 @router.post("/question", response_class=StreamingResponse)
-async def get_response(request: QuestionRequest):
-    chatbot = get_chatbot("LHC_Brochure_2021")
+async def get_response(
+    request: QuestionRequest, x_trace_id: str | None = Header(default=None)
+):
+    start = time.perf_counter()
+    chatbot = get_chatbot(DEFAULT_COLLECTION)
+
+    # Clients send only the new question and the id returned the first time.
+    # A session is only opened on request, so one-off callers leave nothing
+    # behind in the store.
+    session_id = request.session_id
+    if session_id is None and request.start_session:
+        session_id = uuid4().hex
 
-    return StreamingResponse(
-        chatbot.get_answer(request.question, history=request.history)
+    # Spans are logged when the answer ends, for every request or on demand
+    if CONFIG.tracing_enabled or x_trace_id:
+        start_trace(x_trace_id or uuid4().hex)
+
+    # Listeners of an identical answer in progress need no slot of their own
+    seat = chatbot.reserve(request.question, request.history, session_id)
+    ticket = None
+    if seat is None:
+        # Conversations already under way go ahead of new ones
+        priority = 0 if request.session_id else 1
+        try:
+            with span("admission", ADMISSION_WAIT_SECONDS):
+                ticket = await get_admission_controller().acquire(priority)
+        except AdmissionRejected as e:
+            return JSONResponse(
+                {"detail": f"Too many requests ({e.reason}), retry later"},
+                status_code=429,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+    answer = chatbot.aget_answer(
+        request.question,
+        history=request.history,
+        session_id=session_id,
+        ticket=ticket,
+        seat=seat,
+    )
+    headers = {"X-Session-Id": session_id} if session_id is not None else {}
+    return AdmittedStreamingResponse(
+        instrument_stream(answer, start), ticket, seat, headers=headers
     )
+
+
+@router.get("/admission")
+async def admission():
+    return get_admission_controller().stats()
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from api.services.readiness import get_readiness
+
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    readiness = get_readiness()
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from config.conf import CONFIG
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+    controller: "AdmissionController"
+    admitted_at: float = field(default_factory=time.monotonic)
+    released: bool = False
+    # Set when the generation it admitted may outlive the request and
+    # releases the slot itself
+    detached: bool = False
+
+    def release(self) -> None:
+        # Safe to call from every exit path, only the first call counts
+        if not self.released:
+            self.released = True
+            self.controller._release(time.monotonic() - self.admitted_at)
+
+
+@dataclass
+class AdmissionController:
+    max_in_flight: int = CONFIG.admission_max_in_flight
+    max_queue: int = CONFIG.admission_max_queue
+    max_wait: float = CONFIG.admission_max_wait
+    in_flight: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    max_depth: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    # Moving average of how long a generation holds its slot
+    service_time: float = 10.0
+    # (priority, arrival, future): lower priority first, then first come
+    _waiting: list = field(default_factory=list, repr=False)
+    _arrivals: itertools.count = field(default_factory=itertools.count, repr=False)
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for *_, future in self._waiting if not future.done())
+
+    async def acquire(self, priority: int = 0) -> Ticket:
+        start = time.monotonic()
+        if self.in_flight < self.max_in_flight and not self.depth:
+            self.in_flight += 1
+            return self._admit(start)
+
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("queue full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._arrivals), future))
+        self.max_depth = max(self.max_depth, self.depth)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self.timed_out += 1
+                raise AdmissionRejected("queue wait limit", self.retry_after())
+        except asyncio.CancelledError:
+            # The client went away while waiting, pass on a slot it was given
+            if future.done() and not future.cancelled():
+                self._release(None)
+            else:
+                future.cancel()
+            raise
+        return self._admit(start)
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain at the current service rate
+        drain = (self.depth + 1) * self.service_time / self.max_in_flight
+        return max(1, math.ceil(drain))
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "mean_wait": self.wait_total / self.admitted if self.admitted else 0.0,
+            "max_wait": self.wait_max,
+            "service_time": self.service_time,
+        }
+
+    def _admit(self, start: float) -> Ticket:
+        wait = time.monotonic() - start
+        self.admitted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        return Ticket(self)
+
+    def _release(self, held: float | None) -> None:
+        if held is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+        # Hand the slot straight to the next waiter, in_flight stays the same
+        while self._waiting:
+            *_, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+@lru_cache
+def get_admission_controller() -> AdmissionController:
+    return AdmissionController()
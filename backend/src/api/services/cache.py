@@ -0,0 +1,136 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+
+from config.conf import CONFIG
+from rag.template import render_turn
+
+
+def context_digest(context: str, history: list | None = None) -> str:
+    # A follow-up answer only fits the conversation it was written for
+    digest = hashlib.sha256(context.encode("utf-8"))
+    for entry in history or []:
+        digest.update(b"\0" + render_turn(entry).encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    collection_name: str
+    digest: str
+    chunks: list[str]
+    created_at: float
+
+
+@dataclass
+class SemanticCache:
+    threshold: float = CONFIG.semantic_cache_threshold
+    max_size: int = CONFIG.semantic_cache_size
+    ttl: float = CONFIG.semantic_cache_ttl
+    hits: int = 0
+    misses: int = 0
+    _vectors: np.ndarray | None = field(init=False, default=None, repr=False)
+    # slot -> entry, oldest access first
+    _entries: OrderedDict[int, CacheEntry] = field(init=False, repr=False)
+    # (collection_name, digest) -> slots sharing that retrieval context
+    _keys: dict[tuple[str, str], set[int]] = field(init=False, repr=False)
+    _free: list[int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._free = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(
+        self, embedding: np.ndarray, collection_name: str, digest: str
+    ) -> list[str] | None:
+        slots = self._live_slots((collection_name, digest))
+        if not slots:
+            self.misses += 1
+            return None
+
+        similarities = self._vectors[slots] @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        slot = slots[best]
+        self._entries.move_to_end(slot)
+        self.hits += 1
+        return self._entries[slot].chunks
+
+    def store(
+        self,
+        embedding: np.ndarray,
+        collection_name: str,
+        digest: str,
+        chunks: list[str],
+    ) -> None:
+        vector = self._normalize(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+
+        if self._free:
+            slot = self._free.pop()
+        elif len(self._entries) < self.max_size:
+            slot = len(self._entries)
+        else:
+            slot = next(iter(self._entries))
+            self._unindex(slot)
+            del self._entries[slot]
+
+        self._vectors[slot] = vector
+        self._entries[slot] = CacheEntry(
+            collection_name, digest, list(chunks), time.monotonic()
+        )
+        self._keys.setdefault((collection_name, digest), set()).add(slot)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys.clear()
+        self._free.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+    def _live_slots(self, key: tuple[str, str]) -> list[int]:
+        now = time.monotonic()
+        slots = []
+        for slot in list(self._keys.get(key, ())):
+            if now - self._entries[slot].created_at > self.ttl:
+                self._evict(slot)
+            else:
+                slots.append(slot)
+        return slots
+
+    def _evict(self, slot: int) -> None:
+        self._unindex(slot)
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def _unindex(self, slot: int) -> None:
+        entry = self._entries[slot]
+        key = (entry.collection_name, entry.digest)
+        slots = self._keys[key]
+        slots.discard(slot)
+        if not slots:
+            del self._keys[key]
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+@lru_cache
+def get_semantic_cache() -> SemanticCache:
+    return SemanticCache()
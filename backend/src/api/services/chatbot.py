@@ -1,25 +1,234 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator
 from rag.pipeline import (
+    aretrieve_context,
+    agenerate_answer,
     answer_question,
 )
 from dataclasses import dataclass, field
+from rag.embedder import get_embedder
 from rag.model import Model
 from functools import lru_cache
 from rag.llm import get_model
+from api.services.admission import Ticket
+from api.services.cache import SemanticCache, context_digest, get_semantic_cache
+from api.services.coalesce import Seat, SingleFlight
+from rag.embedder import normalize_text
+from rag.template import prefix_digests, render_turn
+from rag.session import (
+    ConversationSession,
+    get_session_generator,
+    get_session_store,
+)
+from config.conf import CONFIG
+from utils.metrics import (
+    RATE_BUCKETS,
+    counter,
+    current_trace,
+    histogram,
+    span,
+)
+
+DEFAULT_COLLECTION = CONFIG.collection_name
+
+# One JSON object per traced request, configured in api.app
+trace_logger = logging.getLogger("chat.trace")
+
+EMBEDDING_SECONDS = histogram("chat_embedding_seconds", "Question embedding latency")
+TIME_TO_FIRST_TOKEN = histogram(
+    "chat_time_to_first_token_seconds", "From request arrival to the first chunk"
+)
+STREAM_SECONDS = histogram(
+    "chat_stream_seconds", "From request arrival to the end of the answer"
+)
+TOKENS_PER_SECOND = histogram(
+    "chat_tokens_per_second", "Streaming rate after the first chunk", RATE_BUCKETS
+)
+ANSWERS = counter("chat_answers_total", "Answers streamed", ("outcome",))
+
+
+async def instrument_stream(
+    chunks: AsyncIterator[str], start: float
+) -> AsyncIterator[str]:
+    # Ollama streams one token per chunk, so chunks stand for tokens
+    first, count, outcome = None, 0, "error"
+    try:
+        async for chunk in chunks:
+            if first is None:
+                first = time.perf_counter()
+                TIME_TO_FIRST_TOKEN.observe(first - start)
+            count += 1
+            yield chunk
+        outcome = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "disconnected"
+        raise
+    finally:
+        end = time.perf_counter()
+        STREAM_SECONDS.observe(end - start)
+        if first is not None and count > 1 and end > first:
+            TOKENS_PER_SECOND.observe((count - 1) / (end - first))
+        ANSWERS.inc(outcome=outcome)
+
+        trace = current_trace()
+        if trace is not None:
+            if first is not None:
+                trace.add("first_token", start, first - start)
+            trace.add("stream", start, end - start)
+            trace_logger.info(json.dumps(trace.report()))
+
+
+def flight_key(question: str, history: list | None) -> tuple[str, str]:
+    # Same question on the same conversation so far: one generation
+    turns = [render_turn(entry) for entry in history or []]
+    return normalize_text(question), prefix_digests(turns)[-1] if turns else ""
 
 
 @dataclass
 class ChatBot:
     filename: str
     model: Model = field(init=False)
+    cache: SemanticCache | None = field(init=False)
+    flights: SingleFlight = field(init=False)
 
     def __post_init__(self):
         self.model = get_model()
+        self.cache = get_semantic_cache() if CONFIG.semantic_cache_enabled else None
+        self.flights = SingleFlight()
 
     def get_answer(self, question: str, history: list | None = None):
-        for chunk in answer_question(question, history=history):
-            print(chunk)
+        yield from answer_question(question, history=history)
+
+    def reserve(
+        self, question: str, history: list | None, session_id: str | None = None
+    ) -> Seat | None:
+        # A seat on an identical generation already under way, taken before
+        # the response starts so that it cannot land in between
+        if not CONFIG.coalesce_enabled:
+            return None
+        if session_id is not None:
+            session = get_session_store().get(session_id)
+            history = session.history or history
+        return self.flights.reserve(flight_key(question, history))
+
+    async def aget_answer(
+        self,
+        question: str,
+        history: list | None = None,
+        session_id: str | None = None,
+        ticket: Ticket | None = None,
+        seat: Seat | None = None,
+    ) -> AsyncIterator[str]:
+        if session_id is None:
+            async for chunk in self._acoalesce(
+                question, history, ticket=ticket, seat=seat
+            ):
+                yield chunk
+            return
+
+        store = get_session_store()
+        async with store.lock(session_id):
+            session = store.get(session_id)
+            # The stored conversation wins, a client history only seeds it
+            if not session.history and history:
+                session.history = list(history)
+
+            chunks, complete = [], False
+            try:
+                async for chunk in self._acoalesce(
+                    question, session.history, session, ticket, seat
+                ):
+                    chunks.append(chunk)
+                    yield chunk
+                complete = True
+            finally:
+                # Also keep what a client that went away had already seen
+                if chunks:
+                    if not complete:
+                        session.context = None
+                    session.add_turn(question, "".join(chunks))
+                    store.save(session)
+
+    async def _acoalesce(
+        self,
+        question: str,
+        history: list | None,
+        session: ConversationSession | None = None,
+        ticket: Ticket | None = None,
+        seat: Seat | None = None,
+    ) -> AsyncIterator[str]:
+        if not CONFIG.coalesce_enabled:
+            async for chunk in self._aanswer(question, history, session):
+                yield chunk
+            return
+
+        if seat is not None:
+            # Admitted as a listener of the flight reserved for this request
+            flight = seat.flight
+            chunks = self.flights.listen(seat)
+        else:
+            history = list(history or [])
+            key = flight_key(question, history)
+
+            # The shared generation gets its own session, never one of a
+            # subscriber that may leave before it ends
+            shared = None
+            if session is not None:
+                shared = ConversationSession(
+                    session.session_id, list(session.history), session.context
+                )
+
+            flight = self.flights.join(
+                key, lambda: self._aanswer(question, history, shared), shared, ticket
+            )
+            chunks = self.flights.subscribe(key, flight)
+
+        async for chunk in chunks:
             yield chunk
 
+        if session is not None:
+            # Whichever request led the flight, its Ollama context fits all
+            leader = flight.state
+            session.context = leader.context if leader is not None else None
+
+    async def _aanswer(
+        self,
+        question: str,
+        history: list | None,
+        session: ConversationSession | None = None,
+    ) -> AsyncIterator[str]:
+        with span("embedding", EMBEDDING_SECONDS):
+            embedding = await get_embedder().aembed_query(question)
+        context = await aretrieve_context(question, self.filename, vector=embedding)
+
+        cacheable = self.cache is not None
+        if cacheable:
+            digest = context_digest(context, history)
+            cached = self.cache.lookup(embedding, self.filename, digest)
+            if cached is not None:
+                if session is not None:
+                    # Ollama never saw this turn, the next one starts over
+                    session.context = None
+                for chunk in cached:
+                    yield chunk
+                return
+
+        if session is not None and CONFIG.generation_sessions:
+            stream = get_session_generator().agenerate(session, question, context)
+        else:
+            stream = agenerate_answer(question, context, history)
+
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+
+        if cacheable:
+            self.cache.store(embedding, self.filename, digest, chunks)
+
 
 @lru_cache
 def get_chatbot(filename: str) -> ChatBot:
@@ -0,0 +1,140 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Hashable
+
+
+@dataclass
+class Flight:
+    chunks: list[str] = field(default_factory=list)
+    done: bool = False
+    error: BaseException | None = None
+    subscribers: int = 0
+    # Whatever the producer leaves behind for its subscribers
+    state: Any = None
+    # Admission ticket of the leader, held until the generation ends
+    ticket: Any = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def stream(self) -> AsyncIterator[str]:
+        # Each subscriber keeps its own position: a late one replays what was
+        # already produced, a slow one never holds up the producer
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+@dataclass
+class Seat:
+    # A listener counted on a flight before it starts streaming, so the
+    # flight is neither cancelled nor forgotten in between
+    flights: "SingleFlight" = field(repr=False)
+    key: Hashable
+    flight: Flight
+    released: bool = False
+
+    def release(self) -> None:
+        # Safe to call from every exit path, only the first call counts
+        if not self.released:
+            self.released = True
+            self.flights._leave(self.key, self.flight)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def active(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def join(
+        self,
+        key: Hashable,
+        produce: Callable[[], AsyncIterator[str]],
+        state: Any = None,
+        ticket: Any = None,
+    ) -> Flight:
+        # produce is only called when no identical flight is under way
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = Flight(state=state, ticket=ticket)
+            if ticket is not None:
+                ticket.detached = True
+            flight.task = asyncio.create_task(self._fly(key, flight, produce()))
+        elif ticket is not None:
+            # Another leader got there first, this request only listens
+            ticket.release()
+        return flight
+
+    def reserve(self, key: Hashable) -> Seat | None:
+        # A seat on the identical flight under way, if any. It replays the
+        # whole answer even when the flight lands before it is used.
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        return self._seat(key, flight)
+
+    async def subscribe(self, key: Hashable, flight: Flight) -> AsyncIterator[str]:
+        async for chunk in self.listen(self._seat(key, flight)):
+            yield chunk
+
+    async def listen(self, seat: Seat) -> AsyncIterator[str]:
+        try:
+            async for chunk in seat.flight.stream():
+                yield chunk
+        finally:
+            seat.release()
+
+    def _seat(self, key: Hashable, flight: Flight) -> Seat:
+        flight.subscribers += 1
+        return Seat(self, key, flight)
+
+    def _leave(self, key: Hashable, flight: Flight) -> None:
+        flight.subscribers -= 1
+        if not flight.subscribers and not flight.done:
+            # Nobody is listening any more
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    async def _fly(self, key: Hashable, flight: Flight, produce: AsyncIterator[str]):
+        try:
+            async for chunk in produce:
+                flight.publish(chunk)
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+        finally:
+            self._forget(key, flight)
+            if flight.ticket is not None:
+                flight.ticket.release()
+
+    def _forget(self, key: Hashable, flight: Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from config.conf import CONFIG
+from rag.llm import get_model
+from rag.pipeline import aretrieve_context
+from rag.template import get_rag_template
+from rag.tokens import get_tokenizer
+
+
+@dataclass
+class Readiness:
+    ready: bool = False
+    attempts: int = 0
+    error: str | None = None
+    # step -> seconds it took on the successful attempt
+    steps: dict[str, float] = field(default_factory=dict)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "error": self.error,
+            "steps": self.steps,
+        }
+
+
+@lru_cache
+def get_readiness() -> Readiness:
+    return Readiness()
+
+
+async def warm_up_once(collection_name: str) -> dict[str, float]:
+    steps = {}
+
+    async def step(name, coroutine):
+        start = time.perf_counter()
+        await coroutine
+        steps[name] = round(time.perf_counter() - start, 3)
+        print(f"Warm-up {name}: {steps[name]:.2f}s")
+
+    async def templates():
+        get_rag_template()
+
+    async def generation():
+        # One token is enough for Ollama to load the weights and keep them
+        # loaded for CONFIG.ollama_keep_alive
+        await get_model().ainvoke("Hello", num_predict=1)
+
+    await step("tokenizer", asyncio.to_thread(get_tokenizer))
+    await step("templates", templates())
+    await step("retrieval", aretrieve_context("What is CERN?", collection_name))
+    await step("generation", generation())
+    return steps
+
+
+async def warm_up(collection_name: str) -> None:
+    readiness = get_readiness()
+    # Dependencies may still be starting next to us, keep trying
+    while not readiness.ready:
+        readiness.attempts += 1
+        try:
+            readiness.steps = await warm_up_once(collection_name)
+        except Exception as e:
+            readiness.error = str(e)
+            print(f"Warm-up failed ({e}), retrying in {CONFIG.warmup_retry_interval}s")
+            await asyncio.sleep(CONFIG.warmup_retry_interval)
+        else:
+            readiness.error = None
+            readiness.ready = True
@@ -12,6 +12,60 @@ class Config(BaseModel):
     unstructured_api_url: str
     unstructured_local_url: str
     ollama_url: str
+    weaviate_host: str = "localhost"
+    weaviate_port: int = 8080
+    weaviate_grpc_port: int = 50051
+    weaviate_pool_size: int = 4
+    weaviate_health_check_interval: float = 30.0
+    weaviate_acquire_timeout: float = 10.0
+    collection_name: str = "LHC_Brochure_2021"
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_size: int = 1024
+    semantic_cache_ttl: float = 3600.0
+    embedder: str = "inference"
+    vectorizer: str = "weaviate"
+    ingest_embedding_batch_size: int = 256
+    embedding_cache_size: int = 4096
+    embedding_cache_path: str | None = None
+    embedding_batch_size: int = 32
+    embedding_batch_wait: float = 0.005
+    retrieval_backend: str = "weaviate"
+    local_index_approximate: bool = False
+    local_index_clusters: int = 0
+    local_index_nprobe: int = 8
+    summary_concurrency: int = 8
+    summary_rate_limit: float | None = 5.0
+    summary_max_retries: int = 3
+    summary_retry_backoff: float = 1.0
+    summary_cache_path: str = "cache/summaries.sqlite"
+    summary_cache_max_entries: int = 100000
+    partition_pages_per_shard: int = 10
+    partition_concurrency: int = 4
+    partition_max_retries: int = 3
+    stream_queue_size: int = 64
+    stream_report_interval: float = 5.0
+    chat_tokenizer: str | None = None
+    history_token_budget: int = 1024
+    history_drop_block: int = 4
+    history_cache_size: int = 1024
+    context_top_k: int = 5
+    context_token_budget: int = 1024
+    context_dedup_threshold: float = 0.8
+    ollama_keep_alive: str = "30m"
+    warmup_enabled: bool = True
+    warmup_retry_interval: float = 5.0
+    generation_sessions: bool = True
+    session_max_context_tokens: int = 1536
+    session_max_entries: int = 1024
+    session_ttl: float = 3600.0
+    session_store: str = "memory"
+    session_store_path: str = "cache/sessions.sqlite"
+    admission_max_in_flight: int = 2
+    admission_max_queue: int = 32
+    admission_max_wait: float = 30.0
+    coalesce_enabled: bool = True
+    tracing_enabled: bool = False
 
 
 config_path = PATH.config / "config.yaml"
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+from config.conf import CONFIG
+from utils.path import PATH
+
+
+def model_identity(model) -> str:
+    return getattr(model, "identity", type(model).__name__)
+
+
+def summary_key(table_text: str, prompt, model) -> str:
+    payload = json.dumps(
+        {"table": table_text, "prompt": prompt, "model": model_identity(model)},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SummaryCache:
+    path: Path
+    max_entries: int = CONFIG.summary_cache_max_entries
+    hits: int = 0
+    misses: int = 0
+    _connection: sqlite3.Connection = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS summaries_accessed_at "
+            "ON summaries (accessed_at)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT summary FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, summary: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                (key, summary, now, now),
+            )
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM summaries"
+            ).fetchone()[0]
+
+    def evict(self) -> int:
+        # Least recently used summaries go first
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                "SELECT key FROM summaries ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+            return cursor.rowcount
+
+    def compact(self) -> None:
+        self.evict()
+        with self._lock:
+            self._connection.execute("VACUUM")
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+@lru_cache
+def get_summary_cache() -> SummaryCache:
+    return SummaryCache(PATH.output / CONFIG.summary_cache_path)
+
+
+if __name__ == "__main__":
+    cache = get_summary_cache()
+    cache.compact()
+    print(f"{cache.path}: {cache.stats()}")
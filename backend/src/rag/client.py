@@ -0,0 +1,285 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Iterator
+
+import weaviate
+from weaviate import WeaviateAsyncClient, WeaviateClient
+
+from config.conf import CONFIG
+
+
+def connect_local() -> WeaviateClient:
+    return weaviate.connect_to_local(
+        host=CONFIG.weaviate_host,
+        port=CONFIG.weaviate_port,
+        grpc_port=CONFIG.weaviate_grpc_port,
+    )
+
+
+@dataclass
+class ClientPool:
+    size: int = CONFIG.weaviate_pool_size
+    health_check_interval: float = CONFIG.weaviate_health_check_interval
+    _idle: list[WeaviateClient] = field(init=False, repr=False)
+    _checked_at: dict[int, float] = field(init=False, repr=False)
+    _created: int = field(init=False, default=0)
+    _closed: bool = field(init=False, default=False)
+    _available: threading.Condition = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._idle = []
+        self._checked_at = {}
+        self._available = threading.Condition()
+
+    def open(self, warm: int = 1) -> None:
+        self._closed = False
+        clients = []
+        try:
+            for _ in range(min(warm, self.size)):
+                clients.append(self.acquire())
+        except Exception as e:
+            print(f"Weaviate warm-up failed: {e}")
+        for client in clients:
+            self.release(client)
+
+    def acquire(self, timeout: float | None = None) -> WeaviateClient:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            client, created = self._take(deadline)
+            if created or self._is_healthy(client):
+                return client
+            # Stale connection: drop it and try the next one, or reconnect
+            # in its slot.
+            self._discard(client)
+
+    def release(self, client: WeaviateClient) -> None:
+        if self._closed:
+            self._discard(client)
+            return
+        with self._available:
+            self._idle.append(client)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, timeout: float | None = None) -> Iterator[WeaviateClient]:
+        client = self.acquire(timeout)
+        try:
+            yield client
+        except Exception:
+            if not self._is_healthy(client, force=True):
+                self._discard(client)
+                client = None
+            raise
+        finally:
+            if client is not None:
+                self.release(client)
+
+    def close(self) -> None:
+        with self._available:
+            self._closed = True
+            clients, self._idle = self._idle, []
+            self._available.notify_all()
+        for client in clients:
+            self._discard(client)
+
+    def _take(self, deadline: float | None) -> tuple[WeaviateClient, bool]:
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                if self._closed:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No Weaviate client available")
+                self._available.wait(remaining)
+            if self._closed:
+                raise RuntimeError("Client pool is closed")
+            if self._idle:
+                return self._idle.pop(), False
+            self._created += 1
+
+        try:
+            return self._connect(), True
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _connect(self) -> WeaviateClient:
+        client = connect_local()
+        self._checked_at[id(client)] = time.monotonic()
+        return client
+
+    def _is_healthy(self, client: WeaviateClient, force: bool = False) -> bool:
+        now = time.monotonic()
+        checked_at = self._checked_at.get(id(client), 0.0)
+        if not force and now - checked_at < self.health_check_interval:
+            return True
+        try:
+            healthy = client.is_connected() and client.is_ready()
+        except Exception:
+            healthy = False
+        if healthy:
+            self._checked_at[id(client)] = now
+        return healthy
+
+    def _free_slot(self) -> None:
+        # A waiter can now connect in the freed slot
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, client: WeaviateClient) -> None:
+        self._checked_at.pop(id(client), None)
+        self._free_slot()
+        try:
+            client.close()
+        except Exception as e:
+            print(f"Error closing Weaviate client: {e}")
+
+
+@lru_cache
+def get_client_pool() -> ClientPool:
+    return ClientPool()
+
+
+def use_async_local() -> WeaviateAsyncClient:
+    return weaviate.use_async_with_local(
+        host=CONFIG.weaviate_host,
+        port=CONFIG.weaviate_port,
+        grpc_port=CONFIG.weaviate_grpc_port,
+    )
+
+
+@dataclass
+class AsyncClientPool:
+    size: int = CONFIG.weaviate_pool_size
+    health_check_interval: float = CONFIG.weaviate_health_check_interval
+    _idle: list[WeaviateAsyncClient] = field(init=False, repr=False)
+    _checked_at: dict[int, float] = field(init=False, repr=False)
+    _created: int = field(init=False, default=0)
+    _closed: bool = field(init=False, default=False)
+    _available: asyncio.Condition = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._idle = []
+        self._checked_at = {}
+        self._available = asyncio.Condition()
+
+    async def open(self, warm: int = 1) -> None:
+        self._closed = False
+        clients = []
+        try:
+            for _ in range(min(warm, self.size)):
+                clients.append(await self.acquire())
+        except Exception as e:
+            print(f"Weaviate async warm-up failed: {e}")
+        for client in clients:
+            await self.release(client)
+
+    async def acquire(self, timeout: float | None = None) -> WeaviateAsyncClient:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            client, created = await self._take(deadline)
+            if created or await self._is_healthy(client):
+                return client
+            await self._discard(client)
+
+    async def release(self, client: WeaviateAsyncClient) -> None:
+        if self._closed:
+            await self._discard(client)
+            return
+        async with self._available:
+            self._idle.append(client)
+            self._available.notify()
+
+    @asynccontextmanager
+    async def connection(
+        self, timeout: float | None = None
+    ) -> AsyncIterator[WeaviateAsyncClient]:
+        client = await self.acquire(timeout)
+        try:
+            yield client
+        except Exception:
+            if not await self._is_healthy(client, force=True):
+                await self._discard(client)
+                client = None
+            raise
+        finally:
+            if client is not None:
+                await self.release(client)
+
+    async def close(self) -> None:
+        async with self._available:
+            self._closed = True
+            clients, self._idle = self._idle, []
+            self._available.notify_all()
+        for client in clients:
+            await self._discard(client)
+
+    async def _take(
+        self, deadline: float | None
+    ) -> tuple[WeaviateAsyncClient, bool]:
+        async with self._available:
+            while not self._idle and self._created >= self.size:
+                if self._closed:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No Weaviate client available")
+                try:
+                    await asyncio.wait_for(self._available.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise TimeoutError("No Weaviate client available") from None
+            if self._closed:
+                raise RuntimeError("Client pool is closed")
+            if self._idle:
+                return self._idle.pop(), False
+            self._created += 1
+
+        try:
+            return await self._connect(), True
+        except BaseException:
+            await self._free_slot()
+            raise
+
+    async def _connect(self) -> WeaviateAsyncClient:
+        client = use_async_local()
+        await client.connect()
+        self._checked_at[id(client)] = time.monotonic()
+        return client
+
+    async def _is_healthy(
+        self, client: WeaviateAsyncClient, force: bool = False
+    ) -> bool:
+        now = time.monotonic()
+        checked_at = self._checked_at.get(id(client), 0.0)
+        if not force and now - checked_at < self.health_check_interval:
+            return True
+        try:
+            healthy = client.is_connected() and await client.is_ready()
+        except Exception:
+            healthy = False
+        if healthy:
+            self._checked_at[id(client)] = now
+        return healthy
+
+    async def _free_slot(self) -> None:
+        async with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    async def _discard(self, client: WeaviateAsyncClient) -> None:
+        self._checked_at.pop(id(client), None)
+        await self._free_slot()
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"Error closing Weaviate client: {e}")
+
+
+@lru_cache
+def get_async_client_pool() -> AsyncClientPool:
+    return AsyncClientPool()
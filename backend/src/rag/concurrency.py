@@ -0,0 +1,90 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class TokenBucket:
+    rate: float
+    capacity: float = 1.0
+    _tokens: float = field(init=False)
+    _updated: float = field(init=False)
+    _lock: threading.Lock = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry(
+    fn: Callable[[], R],
+    retries: int = 3,
+    backoff: float = 1.0,
+    max_backoff: float = 30.0,
+    rate_limiter: TokenBucket | None = None,
+    concurrency: threading.Semaphore | None = None,
+) -> R:
+    # concurrency is only held for the call itself, never while backing off
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            with concurrency or nullcontext():
+                return fn()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(max_backoff, backoff * 2**attempt)
+            delay *= random.uniform(0.5, 1.0)
+            print(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def map_concurrently(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 8,
+    rate_limit: float | None = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    concurrency: threading.Semaphore | None = None,
+) -> list[R | Exception]:
+    # Results keep the order of items, a failed item yields its exception
+    rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+
+    def run(item: T) -> R | Exception:
+        try:
+            return retry(
+                lambda: fn(item),
+                retries=retries,
+                backoff=backoff,
+                rate_limiter=rate_limiter,
+                concurrency=concurrency,
+            )
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, items))
@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import httpx
+import numpy as np
+
+from config.conf import CONFIG
+from utils.path import PATH
+
+
+class Embedder(ABC):
+    name: str
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> np.ndarray: ...
+
+    async def aembed(self, texts: list[str]) -> np.ndarray:
+        return await asyncio.to_thread(self.embed, texts)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        return (await self.aembed([text]))[0]
+
+
+# Same text2vec-transformers container Weaviate uses to vectorize the collections
+@dataclass
+class InferenceEmbedder(Embedder):
+    url: str = CONFIG.inference_url
+    name: str = field(init=False)
+    _client: httpx.Client = field(init=False, repr=False)
+    _async_client: httpx.AsyncClient = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.name = f"text2vec-transformers:{self.url}"
+        self._client = httpx.Client(base_url=self.url)
+        self._async_client = httpx.AsyncClient(base_url=self.url)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for text in texts:
+            response = self._client.post("/vectors", json={"text": text})
+            response.raise_for_status()
+            vectors.append(response.json()["vector"])
+        return np.asarray(vectors, dtype=np.float32)
+
+    async def aembed(self, texts: list[str]) -> np.ndarray:
+        # The inference container embeds one text per call, send them together
+        responses = await asyncio.gather(
+            *[self._async_client.post("/vectors", json={"text": text}) for text in texts]
+        )
+        vectors = []
+        for response in responses:
+            response.raise_for_status()
+            vectors.append(response.json()["vector"])
+        return np.asarray(vectors, dtype=np.float32)
+
+
+# Embeds in-process in large batches, so ingestion no longer makes one
+# vectorizer call per object
+@dataclass
+class SentenceTransformerEmbedder(Embedder):
+    model_name: str = CONFIG.embedding_model
+    batch_size: int = CONFIG.ingest_embedding_batch_size
+    device: str | None = None
+    name: str = field(init=False)
+    _model: object = field(init=False, repr=False)
+
+    def __post_init__(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The sentence-transformers embedder needs the optional "
+                "sentence-transformers package (poetry install -E local-embeddings)"
+            ) from e
+        self.name = f"sentence-transformers:{self.model_name}"
+        self._model = SentenceTransformer(self.model_name, device=self.device)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = self._model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+
+# Deterministic bag-of-words hashing, for running ingestion and retrieval offline
+@dataclass
+class HashEmbedder(Embedder):
+    dim: int = 384
+    name: str = field(init=False)
+
+    def __post_init__(self):
+        self.name = f"hash:{self.dim}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        embed: Callable[[list[str]], Awaitable[np.ndarray]],
+        max_batch: int,
+        max_wait: float,
+    ):
+        self.embed = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._items: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append((text, future))
+        if len(self._items) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if items:
+            task = asyncio.ensure_future(self._run(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: list[tuple[str, asyncio.Future]]) -> None:
+        try:
+            vectors = await self.embed([text for text, _ in items])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(items, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").lower()
+
+
+@dataclass
+class CachedEmbedder(Embedder):
+    embedder: Embedder
+    max_size: int = CONFIG.embedding_cache_size
+    path: Path | None = None
+    batch_size: int = CONFIG.embedding_batch_size
+    batch_wait: float = CONFIG.embedding_batch_wait
+    hits: int = 0
+    misses: int = 0
+    name: str = field(init=False)
+    _cache: OrderedDict[str, np.ndarray] = field(init=False, repr=False)
+    _pending: dict[str, asyncio.Future] = field(init=False, repr=False)
+    _batcher: MicroBatcher = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.name = self.embedder.name
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._batcher = MicroBatcher(
+            self.embedder.aembed, self.batch_size, self.batch_wait
+        )
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self.load()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        keys = [normalize_text(text) for text in texts]
+        vectors = {key: self._get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            for key, vector in zip(missing, self.embedder.embed(missing)):
+                self._put(key, vector)
+                vectors[key] = vector
+        return np.stack([vectors[key] for key in keys])
+
+    async def aembed(self, texts: list[str]) -> np.ndarray:
+        return np.stack(await asyncio.gather(*[self.aembed_query(t) for t in texts]))
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        key = normalize_text(text)
+        vector = self._get(key)
+        if vector is not None:
+            return vector
+
+        # Concurrent requests for the same question share one embedding call
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.ensure_future(self._batcher.submit(key))
+        self._pending[key] = future
+        try:
+            vector = await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+        self._put(key, vector)
+        return vector
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            keys = list(self._cache)
+            vectors = np.stack(list(self._cache.values())) if keys else np.empty(0)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "wb") as f:
+            np.savez(f, name=self.name, keys=np.array(keys), vectors=vectors)
+
+    def load(self) -> None:
+        with np.load(self.path) as data:
+            if str(data["name"]) != self.name:
+                print(f"Ignoring embedding cache {self.path} built by {data['name']}")
+                return
+            keys, vectors = data["keys"], data["vectors"]
+        for key, vector in zip(keys[-self.max_size :], vectors[-self.max_size :]):
+            self._put(str(key), vector)
+
+    def _get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _put(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._cache[key] = np.asarray(vector, dtype=np.float32)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+
+embedders: dict[str, Callable[[], Embedder]] = {
+    "inference": InferenceEmbedder,
+    "sentence-transformers": SentenceTransformerEmbedder,
+    "hash": HashEmbedder,
+}
+
+
+@lru_cache
+def get_base_embedder() -> Embedder:
+    # Queries must land in the space the collections were vectorized in,
+    # with vectorizer: weaviate that is the inference container's. Local
+    # indexes record their own embedder, see LocalIndex.
+    weaviate_vectors = (
+        CONFIG.retrieval_backend == "weaviate" and CONFIG.vectorizer == "weaviate"
+    )
+    if weaviate_vectors and CONFIG.embedder != "inference":
+        raise ValueError(
+            f"embedder: {CONFIG.embedder} cannot query collections vectorized by "
+            "Weaviate, use embedder: inference or vectorizer: embedder"
+        )
+    return embedders[CONFIG.embedder]()
+
+
+@lru_cache
+def get_embedder() -> CachedEmbedder:
+    path = CONFIG.embedding_cache_path
+    return CachedEmbedder(
+        get_base_embedder(),
+        path=PATH.output / path if path else None,
+    )
+
+
+def get_ingest_embedder() -> Embedder | None:
+    # None leaves vectorization to Weaviate's text2vec-transformers module
+    if CONFIG.vectorizer == "embedder":
+        return get_base_embedder()
+    return None
@@ -13,6 +13,10 @@ from utils.tokens import (
 )
 import numpy as np
 import uuid
+from weaviate import WeaviateClient
+from weaviate.classes.query import QueryReference
+from rag.embedder import get_embedder
+from rag.vector import get_local_client
 
 
 logger = logging.getLogger(__name__)
@@ -37,104 +41,149 @@ def cosine_similarity(vec1, vec2):
     
     return similarity
 
-def maximal_marginal_relevance(results, k, lambda_param=0.5):
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(
+    vectors: np.ndarray, distances: np.ndarray, k: int, lambda_param=0.5
+) -> list[int]:
+    # vectors: (n, d) candidates ordered by relevance, distances: (n,)
+    n = len(vectors)
+    if not n or k <= 0:
+        return []
+
+    matrix = normalize(np.asarray(vectors, dtype=np.float64))
+    relevance = (1 - lambda_param) * -np.asarray(distances, dtype=np.float64)
+    max_similarities = np.full(n, -np.inf)
+    available = np.ones(n, dtype=bool)
+
+    # The first candidate is the best ranked one, as returned by the search
+    selected = [0]
+    while len(selected) < min(k, n):
+        last = selected[-1]
+        available[last] = False
+        np.maximum(max_similarities, matrix @ matrix[last], out=max_similarities)
+
+        mmr_scores = relevance - lambda_param * max_similarities
+        mmr_scores[~available] = -np.inf
+        selected.append(int(np.argmax(mmr_scores)))
 
-    selected = []
-    while results and len(selected) < k:
-        if not selected:
-            # Select the document with the highest score for the first selection
-            selected.append(results.pop(0))
-        else:
-            # Compute similarities between selected documents and remaining results
-            similarities = [[cosine_similarity(obj1.vector['default'], obj2.vector['default']) for obj2 in results] for obj1 in selected]
-            max_similarities = np.max(similarities, axis=0)
-            
-            # Compute MMR scores
-            mmr_scores = [(1 - lambda_param) * (-obj.metadata.distance) - lambda_param * max_similarity for (obj, max_similarity) in zip(results, max_similarities)]
-            
-            # Select the document with the highest MMR score
-            selected.append(results.pop(np.argmax(mmr_scores)))
-    
     return selected
 
 
+def batch_mmr_select(
+    vectors: np.ndarray, distances: np.ndarray, k: int, lambda_param=0.5
+) -> np.ndarray:
+    # vectors: (q, n, d), distances: (q, n); pad short queries with np.inf distances
+    n_queries, n, _ = vectors.shape
+    k = min(k, n)
+    if not n_queries or k <= 0:
+        return np.empty((n_queries, 0), dtype=int)
+
+    matrix = normalize(np.asarray(vectors, dtype=np.float64))
+    distances = np.asarray(distances, dtype=np.float64)
+    relevance = np.where(np.isinf(distances), -np.inf, (1 - lambda_param) * -distances)
+    max_similarities = np.full((n_queries, n), -np.inf)
+    available = np.ones((n_queries, n), dtype=bool)
+    rows = np.arange(n_queries)
+
+    selected = np.zeros((n_queries, k), dtype=int)
+    for i in range(1, k):
+        last = selected[:, i - 1]
+        available[rows, last] = False
+        similarities = np.matmul(matrix, matrix[rows, last, :, None])[..., 0]
+        np.maximum(max_similarities, similarities, out=max_similarities)
+
+        mmr_scores = relevance - lambda_param * max_similarities
+        mmr_scores[~available] = -np.inf
+        selected[:, i] = np.argmax(mmr_scores, axis=1)
 
-    
+    return selected
+
+
+def maximal_marginal_relevance(results, k, lambda_param=0.5):
+    if not results:
+        return []
+
+    vectors = np.array([obj.vector["default"] for obj in results])
+    distances = np.array([obj.metadata.distance for obj in results])
+    selected = mmr_select(vectors, distances, k, lambda_param)
+
+    return [results[i] for i in selected]
 
 
+def batch_maximal_marginal_relevance(results_batch, k, lambda_param=0.5):
+    results_batch = list(results_batch)
+    n = max((len(results) for results in results_batch), default=0)
+    if not n:
+        return [[] for _ in results_batch]
 
+    dim = next(
+        len(results[0].vector["default"]) for results in results_batch if results
+    )
+    vectors = np.zeros((len(results_batch), n, dim))
+    distances = np.full((len(results_batch), n), np.inf)
+    for i, results in enumerate(results_batch):
+        if results:
+            vectors[i, : len(results)] = [obj.vector["default"] for obj in results]
+            distances[i, : len(results)] = [obj.metadata.distance for obj in results]
+
+    selected = batch_mmr_select(vectors, distances, k, lambda_param)
 
-def get_reference(self, obj, reference_name: str):
-    property_name = reference_name[0].lower() + reference_name[1:]
-    uuid = obj.properties.get(property_name)
+    return [
+        [results[j] for j in row[: min(k, len(results))]]
+        for results, row in zip(results_batch, selected)
+    ]
 
-    return self._get_reference(reference_name, uuid)
 
-def _get_reference(self, reference_name: str, reference_id: str):
-    reference_collection = self.get_collection(reference_name)
-    objects = {obj.uuid: obj for obj in reference_collection.iterator()}
-    for uuid, obj in objects.items():
-        if uuid == reference_id:
-            return obj
+def get_reference(obj, link_on: str = "from"):
+    references = (obj.references or {}).get(link_on)
+    if references and references.objects:
+        return references.objects[0]
+    return None
 
 
 def query_reference_context(
-    self, collection_name: str, query: str, reference_name: str, top_k: int = 5, k: int = 1, lambda_param=0.5
+    client: WeaviateClient,
+    collection_name: str,
+    query: str,
+    top_k: int = 5,
+    k: int = 1,
+    lambda_param=0.5,
+    link_on: str = "from",
+    vector: np.ndarray | None = None,
 ):
-    collection = self.get_collection(collection_name)
-    results = collection.query.near_text(query, limit=top_k, include_vector=True, return_metadata=["distance"])
-    
-    selected = maximal_marginal_relevance(results.objects, k, lambda_param)
-    selected_references = [self.get_reference(obj, reference_name).properties for obj in selected]
-    return selected_references
+    # Collections may hold external vectors, never rely on a vectorizer
+    if vector is None:
+        vector = get_embedder().embed_query(query)
+    collection = client.collections.get(collection_name)
+    results = collection.query.near_vector(
+        vector.tolist(),
+        limit=top_k,
+        include_vector=True,
+        return_metadata=["distance"],
+        return_references=QueryReference(link_on=link_on),
+    )
 
+    selected = maximal_marginal_relevance(results.objects, k, lambda_param)
+    selected_references = [get_reference(obj, link_on) for obj in selected]
+    return [ref.properties for ref in selected_references if ref is not None]
 
 
 if __name__ == "__main__":
-
-    weaviate_client = Weaviate(
-        embedding_model=CONFIG.embedding_model, wcs_cluster_url=WCS_CLUSTER_URL
-    )
-    # Define constants
     COLLECTION_NAME_CERN = "LHC_Brochure_2021"
-    COLLECTION_NAME_REFERENCE_CERN = "Originals_LHC_Brochure_2021"
-    PROPERTY_NAME_TEXT = "text"
-    PROPERTY_DATA_TYPE_TEXT = wvc.config.DataType.TEXT
-    REFERENCE_NAME_ORIGINAL_DOC = "original_doc"
-    REFERENCE_TEXT = "some reference text"
-    DOCUMENT_TEXT = "some text"
-
-    with weaviate_client as client:
-        """ for col in client.client.collections.list_all():
-            if "LHC" in col:
-                client.client.collections.delete(col) """
-
-        # print(client.client.collections.list_all().keys())
-
-        # collection_name = "Quick_Facts_CERN_2021"
-        # reference_name = f"Originals_{collection_name}"
-        # cern_collection = client.get_collection(collection_name)
-        # reference_collection = client.get_collection(reference_name)
-        # for obj in cern_collection.iterator():
-        #     print(obj.properties['content'])
-        #     uuid = (obj.properties.get(COLLECTION_NAME_REFERENCE_CERN))
-        #     print(uuid)
-        # print(client.get_reference(obj, COLLECTION_NAME_REFERENCE_CERN))
 
+    with get_local_client() as client:
         query = "What is the LHC?"
-        result = client.query_reference_context(COLLECTION_NAME_CERN, query, COLLECTION_NAME_REFERENCE_CERN, top_k=10, k=3)
-        separator = "\n"*2 + "=" * 50 + "\n"*2
-        context = f"{separator}".join([res['content'] for res in result])
+        result = query_reference_context(
+            client,
+            COLLECTION_NAME_CERN,
+            query,
+            top_k=10,
+            k=3,
+        )
+        separator = "\n" * 2 + "=" * 50 + "\n" * 2
+        context = f"{separator}".join([res["text"] for res in result])
         print(context)
-       
-        # print(len(result))
-        for col in client.client.collections.list_all():
-            if "LHC" in col:
-                print(f"{col}: {len(list(client.get_collection(col).iterator()))}")
-
-
-        """ for obj in client.get_collection(COLLECTION_NAME_CERN).iterator():
-            print(obj.properties['type'], obj.properties['originals_LHC_Brochure_2021']) """
-            # print(obj.uuid)
-            
-        # client.client.collections.delete_all()
@@ -0,0 +1,289 @@
+import argparse
+import json
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+from weaviate import WeaviateClient
+from weaviate.classes.query import QueryReference
+from weaviate.util import generate_uuid5
+
+from config.conf import CONFIG
+from rag.embedder import (
+    Embedder,
+    InferenceEmbedder,
+    get_base_embedder,
+    get_embedder,
+)
+from rag.embedding import mmr_select
+from utils.path import PATH
+
+
+def index_directory(collection_name: str) -> Path:
+    return PATH.output / collection_name / "index"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+@dataclass
+class IVFIndex:
+    centroids: np.ndarray
+    # Candidate row ids grouped by cluster, offsets[i]:offsets[i + 1] is cluster i
+    members: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def train(
+        cls, vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0
+    ) -> "IVFIndex":
+        rng = np.random.default_rng(seed)
+        n_clusters = max(1, min(n_clusters, len(vectors)))
+        centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for cluster in range(n_clusters):
+                members = vectors[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = normalize_rows(centroids)
+
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        members = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_clusters)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(centroids, members, offsets)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = min(nprobe, len(self.centroids))
+        clusters = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self.members[self.offsets[c] : self.offsets[c + 1]] for c in clusters]
+        )
+
+    def save(self, path: Path) -> None:
+        np.savez(
+            path, centroids=self.centroids, members=self.members, offsets=self.offsets
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["members"], data["offsets"])
+
+
+@dataclass
+class LocalIndex:
+    directory: Path
+    vectors: np.ndarray = field(init=False, repr=False)
+    ids: list[str] = field(init=False, repr=False)
+    texts: list[str] = field(init=False, repr=False)
+    originals: list[dict[str, Any] | None] = field(init=False, repr=False)
+    ivf: IVFIndex | None = field(init=False, default=None, repr=False)
+    nprobe: int = CONFIG.local_index_nprobe
+
+    def __post_init__(self):
+        with open(self.directory / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # Vectors from another model would be compared with queries silently
+        embedder = get_embedder().name
+        if meta["embedder"] != embedder:
+            raise ValueError(
+                f"Index in {self.directory} was built with {meta['embedder']} "
+                f"but queries use {embedder}, rebuild it"
+            )
+
+        # Read-only mapping: every worker shares the same page-cached copy
+        self.vectors = np.memmap(
+            self.directory / "vectors.f32",
+            dtype=np.float32,
+            mode="r",
+            shape=(meta["count"], meta["dim"]),
+        )
+        self.ids, self.texts, self.originals = [], [], []
+        with open(self.directory / "records.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.texts.append(record["text"])
+                self.originals.append(record.get("original"))
+
+        ivf_path = self.directory / "ivf.npz"
+        if CONFIG.local_index_approximate and ivf_path.exists():
+            self.ivf = IVFIndex.load(ivf_path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, vector: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        query = normalize_rows(vector[None, :])[0]
+        if self.ivf is not None:
+            candidates = self.ivf.candidates(query, self.nprobe)
+            scores = self.vectors[candidates] @ query
+        else:
+            candidates = None
+            scores = self.vectors @ query
+
+        top_k = min(top_k, len(scores))
+        if not top_k:
+            return np.empty(0, dtype=int), np.empty(0, dtype=np.float32)
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        rows = best if candidates is None else candidates[best]
+        # Cosine distance, as reported by Weaviate
+        return rows, 1 - scores[best]
+
+    def find_context(
+        self, question: str, top_k: int = 3, vector: np.ndarray | None = None
+    ) -> list[str]:
+        if vector is None:
+            vector = get_embedder().embed_query(question)
+        rows, _ = self.search(vector, top_k)
+        return [self.texts[row] for row in rows]
+
+    def query_reference_context(
+        self,
+        query: str,
+        top_k: int = 5,
+        k: int = 1,
+        lambda_param=0.5,
+        vector: np.ndarray | None = None,
+    ) -> list[dict[str, Any]]:
+        if vector is None:
+            vector = get_embedder().embed_query(query)
+        rows, distances = self.search(vector, top_k)
+        selected = mmr_select(self.vectors[rows], distances, k, lambda_param)
+        originals = [self.originals[rows[i]] for i in selected]
+        return [original for original in originals if original is not None]
+
+
+def write_index(
+    directory: Path,
+    ids: list[str],
+    vectors: np.ndarray,
+    texts: list[str],
+    originals: list[dict[str, Any] | None],
+    embedder: str,
+) -> None:
+    if not ids:
+        raise ValueError(f"No objects to index in {directory}")
+
+    directory.mkdir(parents=True, exist_ok=True)
+    vectors = normalize_rows(vectors)
+
+    matrix = np.memmap(
+        directory / "vectors.f32", dtype=np.float32, mode="w+", shape=vectors.shape
+    )
+    matrix[:] = vectors
+    matrix.flush()
+
+    with open(directory / "records.jsonl", "w", encoding="utf-8") as f:
+        for record_id, text, original in zip(ids, texts, originals):
+            record = {"id": record_id, "text": text, "original": original}
+            f.write(json.dumps(record) + "\n")
+
+    # Only trained when searches will use it, never left stale otherwise
+    ivf_path = directory / "ivf.npz"
+    clusters = CONFIG.local_index_clusters or int(np.sqrt(len(vectors)))
+    if CONFIG.local_index_approximate and len(vectors) and clusters > 1:
+        IVFIndex.train(vectors, clusters).save(ivf_path)
+    else:
+        ivf_path.unlink(missing_ok=True)
+
+    meta = {"count": len(ids), "dim": vectors.shape[1], "embedder": embedder}
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def export_from_weaviate(
+    client: WeaviateClient, collection_name: str, directory: Path | None = None
+) -> None:
+    # Stored vectors are in the space of whatever vectorized the collection
+    if CONFIG.vectorizer == "embedder":
+        embedder = get_base_embedder()
+    else:
+        embedder = InferenceEmbedder()
+    collection = client.collections.get(collection_name)
+    ids, vectors, texts, originals = [], [], [], []
+    for obj in collection.iterator(
+        include_vector=True, return_references=QueryReference(link_on="from")
+    ):
+        references = (obj.references or {}).get("from")
+        ids.append(str(obj.uuid))
+        vectors.append(obj.vector["default"])
+        texts.append(obj.properties["text"])
+        has_original = references is not None and references.objects
+        originals.append(references.objects[0].properties if has_original else None)
+
+    write_index(
+        directory or index_directory(collection_name),
+        ids,
+        np.asarray(vectors, dtype=np.float32),
+        texts,
+        originals,
+        embedder=embedder.name,
+    )
+
+
+def build_from_processed(
+    collection_name: str,
+    data: dict[str, Iterable],
+    embedder: Embedder | None = None,
+    directory: Path | None = None,
+    batch_size: int = 64,
+) -> None:
+    # Documents skip the query cache and its text normalization
+    embedder = embedder or get_base_embedder()
+    original, processed = data["original"], data["processed"]
+    pairs = [
+        *zip(original.get("images", []), processed.get("image_summaries", [])),
+        *zip(original.get("tables", []), processed.get("tables", [])),
+        *zip(original.get("texts", []), processed.get("texts", [])),
+    ]
+
+    texts = [processed["text"] for _, processed in pairs]
+    vectors = [
+        embedder.embed(texts[start : start + batch_size])
+        for start in range(0, len(texts), batch_size)
+    ]
+
+    write_index(
+        directory or index_directory(collection_name),
+        [generate_uuid5(processed) for _, processed in pairs],
+        np.concatenate(vectors) if vectors else np.empty((0, 0)),
+        texts,
+        [original for original, _ in pairs],
+        embedder=embedder.name,
+    )
+
+
+@lru_cache
+def get_local_index(collection_name: str) -> LocalIndex:
+    return LocalIndex(index_directory(collection_name))
+
+
+if __name__ == "__main__":
+    from rag.pipeline import load_file_data
+    from rag.vector import get_local_client
+
+    parser = argparse.ArgumentParser(description="Build a local retrieval index")
+    parser.add_argument("collection_name")
+    parser.add_argument(
+        "--source", choices=["weaviate", "processed"], default="weaviate"
+    )
+    args = parser.parse_args()
+
+    if args.source == "weaviate":
+        with get_local_client() as client:
+            export_from_weaviate(client, args.collection_name)
+    else:
+        data = load_file_data(PATH.output / args.collection_name / "processed.jsonl")
+        build_from_processed(args.collection_name, data)
+
+    index = get_local_index(args.collection_name)
+    print(f"Indexed {len(index)} objects in {index.directory}")
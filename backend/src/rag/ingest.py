@@ -0,0 +1,279 @@
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from config.conf import CONFIG
+from rag.client import get_client_pool
+from rag.parse import elements_path, partition_file
+from rag.store import RecordReader, index_path
+from rag.stream import stream_file
+from rag.pipeline import (
+    embed_data,
+    save_file_data,
+    select_elements,
+    summarize_elements,
+)
+from utils.metrics import REGISTRY, histogram
+from utils.path import PATH
+
+INGEST_STAGE_SECONDS = histogram(
+    "ingest_stage_seconds",
+    "Time spent per file in each ingestion stage",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+    labels=("stage",),
+)
+
+STAGES = ("partition", "summarize", "embed")
+
+
+def collection_name_for(filepath: Path) -> str:
+    # Weaviate collection names: a capital letter then letters, digits or '_'
+    name = re.sub(r"\W+", "_", filepath.stem).strip("_")
+    return name[:1].upper() + name[1:]
+
+
+def file_digest(filepath: Path) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remove_artifacts(filepath: Path) -> None:
+    # Everything a stage derived from the file, current and legacy formats
+    output_dir = PATH.output / filepath.stem
+    for path in (elements_path(filepath), output_dir / "processed.jsonl"):
+        for artifact in (path, index_path(path), path.with_suffix(".json")):
+            artifact.unlink(missing_ok=True)
+
+
+def select_elements_from_file(filepath: Path) -> dict[str, list]:
+    # Runs in the process pool: parsing and sorting stay off the I/O threads
+    return select_elements(partition_file(filepath))
+
+
+@dataclass
+class Checkpoint:
+    path: Path
+    # Digest of the file the stages were run on
+    source: str | None = None
+    stages: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint":
+        if not path.exists():
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        # Checkpoints without a digest predate it and are never trusted
+        return cls(path, state.get("source"), state.get("stages", {}))
+
+    def done(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def mark(self, stage: str, items: int, seconds: float) -> None:
+        self.stages[stage] = {
+            "items": items,
+            "seconds": seconds,
+            "finished_at": time.time(),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "stages": self.stages}, f, indent=2)
+
+    def reset(self, source: str) -> None:
+        self.source = source
+        self.stages = {}
+        self.path.unlink(missing_ok=True)
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    seconds: float = 0.0
+    files: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self.items += items
+            self.seconds += seconds
+            self.files += 1
+
+
+@dataclass
+class Ingestion:
+    network_concurrency: int = 4
+    # One collection for every file, else one per file named after it
+    collection_name: str | None = None
+    cpu_workers: int = 2
+    incremental: bool = False
+    restart: bool = False
+    streaming: bool = False
+    model: object | None = None
+    stats: dict[str, StageStats] = field(init=False)
+    _network: threading.BoundedSemaphore = field(init=False, repr=False)
+    _cpu: ProcessPoolExecutor = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self._network = threading.BoundedSemaphore(self.network_concurrency)
+
+    def run(self, filepaths: list[Path], workers: int = 4) -> dict[Path, Exception]:
+        failures = {}
+        self._cpu = ProcessPoolExecutor(self.cpu_workers)
+        with self._cpu, ThreadPoolExecutor(workers) as executor:
+            futures = {
+                executor.submit(self.ingest_file, filepath): filepath
+                for filepath in filepaths
+            }
+            for future in as_completed(futures):
+                filepath = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Failed to ingest {filepath.name}: {e}")
+                    failures[filepath] = e
+        return failures
+
+    def ingest_file(self, filepath: Path) -> None:
+        output_dir = PATH.output / filepath.stem
+        processed_file = output_dir / "processed.jsonl"
+        collection_name = self.collection_name or collection_name_for(filepath)
+
+        source = file_digest(filepath)
+        checkpoint = Checkpoint.load(output_dir / "checkpoint.json")
+        if self.restart or checkpoint.source != source:
+            # Nothing derived from another version of the file is reused
+            remove_artifacts(filepath)
+            checkpoint.reset(source)
+
+        # The network limit is held per request, not per stage, so that
+        # files in flight share it fairly
+        if self.streaming and not checkpoint.done("embed"):
+            start = time.perf_counter()
+            pipeline = stream_file(
+                filepath,
+                collection_name,
+                self.model,
+                incremental=self.incremental,
+                concurrency=self._network,
+            )
+            print(pipeline.report())
+            stats = pipeline.stats()
+            for stage, name in zip(STAGES, ("partition", "summarize", "insert")):
+                self._finish(checkpoint, stage, stats[name]["processed"], start)
+
+        if not checkpoint.done("partition"):
+            start = time.perf_counter()
+            elements = partition_file(filepath, concurrency=self._network)
+            if not elements:
+                raise RuntimeError("partitioning returned no elements")
+            self._finish(checkpoint, "partition", len(elements), start)
+
+        if not checkpoint.done("summarize"):
+            start = time.perf_counter()
+            selected = self._cpu.submit(select_elements_from_file, filepath)
+            selected = selected.result()
+            data = summarize_elements(selected, self.model, concurrency=self._network)
+            save_file_data(processed_file, data)
+            self._finish(checkpoint, "summarize", len(selected["tables"]), start)
+
+        if not checkpoint.done("embed"):
+            start = time.perf_counter()
+            records = RecordReader(processed_file)
+            # Bounded by the Weaviate client pool instead
+            embed_data(collection_name, records, incremental=self.incremental)
+            self._finish(checkpoint, "embed", len(records), start)
+
+        print(f"Ingested {filepath.name} into {collection_name}")
+
+    def _finish(
+        self, checkpoint: Checkpoint, stage: str, items: int, start: float
+    ) -> None:
+        seconds = time.perf_counter() - start
+        checkpoint.mark(stage, items, seconds)
+        self.stats[stage].add(items, seconds)
+        INGEST_STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def report(self) -> str:
+        lines = [
+            f"{'stage':<10} {'files':>6} {'items':>7} {'seconds':>9} {'items/s':>9}"
+        ]
+        for stage, stats in self.stats.items():
+            rate = stats.items / stats.seconds if stats.seconds else 0.0
+            lines.append(
+                f"{stage:<10} {stats.files:>6} {stats.items:>7} "
+                f"{stats.seconds:>9.1f} {rate:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory of PDFs")
+    parser.add_argument("--resources", type=Path, default=PATH.resources)
+    parser.add_argument("--pattern", default="*.pdf")
+    parser.add_argument("--workers", type=int, default=4, help="files in flight")
+    parser.add_argument("--network-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--collection",
+        help=f"target collection, {CONFIG.collection_name} (served by the API) "
+        "when a single file is ingested, else one collection per file",
+    )
+    parser.add_argument("--cpu-workers", type=int, default=2)
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore existing checkpoints"
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="overlap partitioning, summaries and inserts per file",
+    )
+    args = parser.parse_args()
+
+    filepaths = sorted(args.resources.glob(args.pattern))
+    print(f"Found {len(filepaths)} files in {args.resources}")
+
+    # A collection is synced as a whole, so it holds exactly one file
+    collection_name = args.collection
+    if collection_name is not None and len(filepaths) > 1:
+        parser.error("--collection takes a single file, narrow --pattern")
+    if collection_name is None and len(filepaths) == 1:
+        collection_name = CONFIG.collection_name
+    if collection_name is None:
+        print(
+            f"One collection per file, the API serves {CONFIG.collection_name}: "
+            "set collection_name in config.yaml to serve another"
+        )
+
+    ingestion = Ingestion(
+        network_concurrency=args.network_concurrency,
+        collection_name=collection_name,
+        cpu_workers=args.cpu_workers,
+        incremental=args.incremental,
+        restart=args.restart,
+        streaming=args.streaming,
+    )
+    start = time.perf_counter()
+    try:
+        failures = ingestion.run(filepaths, workers=args.workers)
+    finally:
+        get_client_pool().close()
+
+    print(ingestion.report())
+    print(
+        f"{len(filepaths) - len(failures)}/{len(filepaths)} files ingested "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+    # Same format as /metrics, for the node exporter textfile collector
+    metrics_file = PATH.output / "ingest_metrics.prom"
+    metrics_file.write_text(REGISTRY.render(), encoding="utf-8")
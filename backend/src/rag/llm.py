@@ -13,6 +13,7 @@ def get_model(model: str | None = None, verbose: bool = False):
         verbose=verbose,
         num_gpu=2,
         num_thread=12,
+        keep_alive=CONFIG.ollama_keep_alive,
     )
 
     return ollama
@@ -5,6 +5,7 @@ from dataclasses import dataclass, field
 from utils.path import PATH
 
 import cohere
+import time
 
 
 @dataclass
@@ -13,6 +14,10 @@ class Model:
     model: InferenceClient = field(init=False)
     tokenizer: AutoTokenizer = field(init=False)
 
+    @property
+    def identity(self) -> str:
+        return f"huggingface:{self.model_name}"
+
     def __post_init__(self):
         self.model = InferenceClient(model=self.model_name, token=HF_API_KEY)
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
@@ -33,6 +38,8 @@ class Model:
 class Cohere:
     model: cohere.Client = field(init=False)
 
+    identity = "cohere:chat"
+
     def __post_init__(self):
         self.model = cohere.Client(COHERE_API_KEY)
 
@@ -49,3 +56,17 @@ class Cohere:
         data = response.__dict__
         data["message"] = data.pop("text")
         return data["message"]
+
+
+@dataclass
+class StubModel:
+    latency: float = 0.0
+    identity = "stub"
+
+    def format_prompt(self, prompt: str) -> str:
+        return prompt
+
+    def text_generation(self, prompt: str) -> str:
+        time.sleep(self.latency)
+        message = prompt[-1]["content"]
+        return f"Summary of {len(message)} characters: {message[:80]}"
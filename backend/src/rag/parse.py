@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Any
+from typing import Any, Iterable
 from unstructured.documents.elements import Element
 from unstructured_client import UnstructuredClient
 from utils.path import PATH
@@ -8,7 +8,13 @@ from config.conf import CONFIG
 from utils.tokens import UNSTRUCTURED_API_KEY
 from unstructured_client.models import shared
 from unstructured_client.models.errors import SDKError
+from contextlib import nullcontext
+import io
 import json
+import threading
+from pypdf import PdfReader, PdfWriter
+from rag.concurrency import map_concurrently
+from rag.store import RecordReader, is_complete, write_records
 
 # docker run -dt --name unstructured -p 5000:5000 --rm -e PORT=5000 -v C:/Users/flore/Documents/code/CERN-RAG/backend/resources:/app/resources downloads.unstructured.io/unstructured-io/unstructured-api:latest
 
@@ -22,24 +28,11 @@ def get_unstructured_client():
     )
 
 
-def partition_file(filepath: Path):
-
-    output_file: Path = PATH.output / filepath.stem / "elements.json"
-    if Path.exists(output_file):
-        print(f"Loading {output_file}")
-        with open(output_file, "r", encoding="utf-8") as f:
-            elements = json.load(f)
-            return elements
-
-    client = get_unstructured_client()
-    print(f"Processing {filepath}")
-
-    file = open(filepath, "rb")
-
-    req = shared.PartitionParameters(
+def partition_request(content: bytes, file_name: str) -> shared.PartitionParameters:
+    return shared.PartitionParameters(
         files=shared.Files(
-            content=file.read(),
-            file_name=str(filepath),
+            content=content,
+            file_name=file_name,
         ),
         strategy="auto",
         # hi_res_model_name="yolox",
@@ -49,26 +42,113 @@ def partition_file(filepath: Path):
         languages=["eng"],
     )
 
+
+def split_pdf(content: bytes, pages_per_shard: int) -> list[tuple[int, bytes]]:
+    reader = PdfReader(io.BytesIO(content))
+    shards = []
+    for start in range(0, len(reader.pages), pages_per_shard):
+        writer = PdfWriter()
+        for page in reader.pages[start : start + pages_per_shard]:
+            writer.add_page(page)
+        shard = io.BytesIO()
+        writer.write(shard)
+        shards.append((start, shard.getvalue()))
+    return shards
+
+
+def partition_shard(filepath: Path, first_page: int, content: bytes) -> list[Any]:
+    client = get_unstructured_client()
+    res = client.general.partition(partition_request(content, str(filepath)))
+    elements = res.elements or []
+    # Shards restart their numbering at page 1
+    for element in elements:
+        metadata = element.get("metadata", {})
+        if "page_number" in metadata:
+            metadata["page_number"] += first_page
+    return elements
+
+
+def partition_sharded(
+    filepath: Path,
+    content: bytes,
+    pages_per_shard: int = CONFIG.partition_pages_per_shard,
+    max_workers: int = CONFIG.partition_concurrency,
+    concurrency: threading.Semaphore | None = None,
+) -> list[Any]:
+    shards = split_pdf(content, pages_per_shard)
+    print(f"Partitioning {filepath} in {len(shards)} shards")
+
+    results = map_concurrently(
+        lambda shard: partition_shard(filepath, *shard),
+        shards,
+        max_workers=max_workers,
+        retries=CONFIG.partition_max_retries,
+        concurrency=concurrency,
+    )
+
+    elements = []
+    for (first_page, _), result in zip(shards, results):
+        if isinstance(result, Exception):
+            last_page = first_page + pages_per_shard
+            print(f"Pages {first_page + 1}-{last_page} failed: {result}")
+            return []
+        elements.extend(result)
+    return elements
+
+
+def elements_path(filepath: Path) -> Path:
+    return PATH.output / filepath.stem / "elements.jsonl"
+
+
+def partition_file(
+    filepath: Path,
+    sharded: bool = True,
+    concurrency: threading.Semaphore | None = None,
+) -> Iterable[dict]:
+
+    output_file = elements_path(filepath)
+    if is_complete(output_file):
+        print(f"Loading {output_file}")
+        return RecordReader(output_file)
+
+    legacy_file = output_file.with_suffix(".json")
+    if Path.exists(legacy_file):
+        print(f"Loading {legacy_file}")
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            elements = json.load(f)
+            return elements
+
+    client = get_unstructured_client()
+    print(f"Processing {filepath}")
+
+    with open(filepath, "rb") as file:
+        content = file.read()
+
     elements = []
-    try:
-        res = client.general.partition(req)
-        elements = res.elements
-    except SDKError as e:
-        print(e)
+    if sharded and CONFIG.partition_pages_per_shard and filepath.suffix == ".pdf":
+        elements = partition_sharded(filepath, content, concurrency=concurrency)
+    else:
+        try:
+            with concurrency or nullcontext():
+                res = client.general.partition(
+                    partition_request(content, str(filepath))
+                )
+            elements = res.elements
+        except SDKError as e:
+            print(e)
 
     if elements:
         save_elements(output_file, elements)
+        return RecordReader(output_file)
 
     return elements
 
 
-def save_elements(output_file: Path, elements: list[Any]):
-    output_file.parent.mkdir(exist_ok=True)
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(elements, f, indent=2)
+def save_elements(output_file: Path, elements: Iterable[Any]) -> int:
+    return write_records(output_file, elements, key=lambda el: el.get("element_id"))
 
 
-def sort_elements(elements: list[Element]) -> dict[str, list[Element]]:
+def sort_elements(elements: Iterable[Element]) -> dict[str, list[Element]]:
     sorted_elements = {}
     for el in elements:
         category = el["type"]
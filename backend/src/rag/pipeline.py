@@ -1,40 +1,49 @@
+import threading
 import time
 import PIL
 import io
 import json
 import base64
+import numpy as np
 from rag.parse import partition_file, sort_elements
-from rag.query import find_context, format_context
+from rag.query import afind_context, find_context, format_context
 from utils.path import PATH
 from rag.preprocess import (
-    get_table_summary,
+    get_table_summaries,
     get_image_summary,
-    images2docs,
-    tables2docs,
-    texts2docs,
 )
 from rag.model import Cohere, Model
 from rag.vector import (
     add_doc_with_ref,
+    add_docs_with_refs,
     add_document,
     create_reference_and_collection,
     get_local_client,
+    sync_docs_with_refs,
 )
+from rag.client import get_async_client_pool, get_client_pool
+from rag.embedder import get_embedder, get_ingest_embedder
+from rag.index import get_local_index
+from rag.store import RecordReader, is_complete, write_records
 from pathlib import Path
 
-from typing import Any, Iterable
+from typing import Any, AsyncIterator, Iterable, Iterator
 from config.conf import CONFIG
-from databases.postgres.crud import (
-    insert_file_content,
-    get_file_by_name,
-    get_reference,
-)
 from rag.llm import get_model
 
-from rag.template import get_rag_template, get_qa_prompt
+from rag.template import DEFAULT_SYSTEM, build_prompt, get_qa_prompt
+from utils.metrics import histogram, span
 from dataclasses import dataclass
 
 
+RETRIEVAL_SECONDS = histogram(
+    "rag_retrieval_seconds", "Vector search latency", labels=("backend",)
+)
+CONTEXT_PACKING_SECONDS = histogram(
+    "rag_context_packing_seconds", "Time to deduplicate and pack retrieved chunks"
+)
+
+
 @dataclass
 class Image:
     name: str
@@ -55,11 +64,54 @@ def get_resized_image_bytes(image_path, max_size=(800, 800)):
     return byte_arr.getvalue()
 
 
+def select_elements(elements: Iterable[dict]) -> dict[str, list]:
+    sorted_elements = sort_elements(elements)
+
+    # for table in tables:
+    #     table["metadata"].pop("table_as_cells", None)
+
+    return {
+        "tables": sorted_elements.get("Table", []),
+        "texts": sorted_elements.get("CompositeElement", []),
+    }
+
+
+def summarize_elements(
+    selected: dict[str, list],
+    model=None,
+    concurrency: threading.Semaphore | None = None,
+) -> dict[str, Iterable]:
+    # T2T_model = Model(CONFIG.text_to_text_model)
+    T2T_model = model or Cohere()
+
+    tables = selected["tables"]
+    texts = selected["texts"]
+
+    tables_summaries = get_table_summaries(
+        T2T_model, tables, concurrency=concurrency
+    )
+
+    processed_texts = [text for text in texts]
+    data = {
+        "original": {
+            # "images": image_bytes,
+            "tables": tables,
+            "texts": texts,
+        },
+        "processed": {
+            # "image_summaries": image_summaries,
+            "tables": tables_summaries,
+            "texts": processed_texts,
+        },
+    }
+
+    return data
+
+
 def data_from_file(filename: str) -> dict[str, Iterable]:
     filepath = PATH.resources / filename
 
     elements = partition_file(filepath)
-    sorted_elements = sort_elements(elements)
     """ I2T_model = Model(CONFIG.image_to_text_model)
     try:
         images = [
@@ -78,80 +130,117 @@ def data_from_file(filename: str) -> dict[str, Iterable]:
     finally:
         temp_folder.cleanup() """
 
-    tables = [table for table in sorted_elements["Table"]]
-    texts = [text for text in sorted_elements["CompositeElement"]]
+    return summarize_elements(select_elements(elements))
 
-    # for table in tables:
-    #     table["metadata"].pop("table_as_cells", None)
 
-    # T2T_model = Model(CONFIG.text_to_text_model)
-    T2T_model = Cohere()
+DATA_KINDS = (("images", "image_summaries"), ("tables", "tables"), ("texts", "texts"))
 
-    tables_summaries = [get_table_summary(T2T_model, table) for table in tables]
 
-    processed_texts = [text for text in texts]
-    data = {
-        "original": {
-            # "images": image_bytes,
-            "tables": tables,
-            "texts": texts,
-        },
-        "processed": {
-            # "image_summaries": image_summaries,
-            "tables": tables_summaries,
-            "texts": processed_texts,
-        },
-    }
+def data_records(data: dict[str, Iterable]) -> Iterator[dict]:
+    for original_key, processed_key in DATA_KINDS:
+        originals = data["original"].get(original_key, [])
+        processed = data["processed"].get(processed_key, [])
+        for original, processed_element in zip(originals, processed):
+            yield {
+                "kind": original_key,
+                "original": original,
+                "processed": processed_element,
+            }
 
-    return data
+
+def data_pairs(data: dict[str, Iterable] | Iterable[dict]) -> Iterator[tuple]:
+    records = data_records(data) if isinstance(data, dict) else data
+    for record in records:
+        yield record["original"], record["processed"]
 
 
 def save_file_data(output_file: Path, data: dict[str, Iterable]) -> None:
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(data, f)
+    write_records(
+        output_file,
+        data_records(data),
+        key=lambda record: record["original"].get("element_id"),
+    )
 
 
 def load_file_data(output_file: Path) -> dict[str, Iterable]:
-    with open(output_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    if output_file.suffix == ".json":
+        with open(output_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data
+
+    data = {"original": {}, "processed": {}}
+    for record in RecordReader(output_file):
+        original_key = record["kind"]
+        processed_key = dict(DATA_KINDS)[original_key]
+        data["original"].setdefault(original_key, []).append(record["original"])
+        data["processed"].setdefault(processed_key, []).append(record["processed"])
     return data
 
 
-def embed_data(collection_name: str, data: dict[str, Iterable]) -> None:
+def embed_data(
+    collection_name: str,
+    data: dict[str, Iterable] | Iterable[dict],
+    batched: bool = True,
+    incremental: bool = False,
+) -> None:
 
-    original_images = data["original"].get("images", [])
-    original_tables = data["original"].get("tables", [])
-    original_texts = data["original"].get("texts", [])
-    processed_images = data["processed"].get("image_summaries", [])
-    processed_tables = data["processed"].get("tables", [])
-    processed_texts = data["processed"].get("texts", [])
+    pairs = data_pairs(data)
+    embedder = get_ingest_embedder()
 
-    with get_local_client() as client:
+    with get_client_pool().connection() as client:
         reference_name = f"Originals_{collection_name}"
-        create_reference_and_collection(client, collection_name, reference_name)
-
-        for image, processed_image in zip(original_images, processed_images):
-            add_doc_with_ref(
-                client, collection_name, reference_name, image, processed_image
+        create_reference_and_collection(
+            client,
+            collection_name,
+            reference_name,
+            delete_if_exists=not incremental,
+            external_vectors=embedder is not None,
+        )
+
+        if incremental:
+            report = sync_docs_with_refs(
+                client, collection_name, reference_name, pairs, embedder=embedder
             )
-
-        for table, processed_table in zip(original_tables, processed_tables):
-            add_doc_with_ref(
-                client, collection_name, reference_name, table, processed_table
+            failed_objects = report.failed_objects
+            print(
+                f"Synced {collection_name}: {report.inserted} inserted, "
+                f"{report.relinked} relinked, {report.deleted} deleted, "
+                f"{report.unchanged} unchanged"
             )
-
-        for text, processed_text in zip(original_texts, processed_texts):
-            add_doc_with_ref(
-                client, collection_name, reference_name, text, processed_text
+        elif batched:
+            failed_objects = add_docs_with_refs(
+                client, collection_name, reference_name, pairs, embedder=embedder
             )
-
-
-def process_pdf_file(collection_name: str) -> dict[str, Iterable[Any]]:
-
-    output_file = PATH.output / collection_name / "processed.json"
-    if output_file.exists():
+            print(f"Ingested documents into {collection_name}")
+        else:
+            for original, processed in pairs:
+                add_doc_with_ref(
+                    client,
+                    collection_name,
+                    reference_name,
+                    original,
+                    processed,
+                    embedder,
+                )
+            return
+
+    for failed in failed_objects:
+        print(f"Failed to insert {failed.object_.uuid}: {failed.message}")
+
+
+def process_pdf_file(
+    collection_name: str, filename: str | None = None
+) -> dict[str, Iterable[Any]]:
+    filename = filename or f"{collection_name}.pdf"
+
+    output_file = PATH.output / Path(filename).stem / "processed.jsonl"
+    if is_complete(output_file):
         print(f"Loading data from {output_file}")
         return load_file_data(output_file)
+    legacy_file = output_file.with_suffix(".json")
+    if legacy_file.exists():
+        print(f"Loading data from {legacy_file}")
+        return load_file_data(legacy_file)
 
     print(f"Processing {collection_name}")
     data = data_from_file(filename)
@@ -163,29 +252,87 @@ def answer_question(
     question: str,
     collection_name: str = "LHC_Brochure_2021",
     history: list | None = None,
-    system: str = "You are an assistant tasked with answering questions. Use the context provided, just answer the question straight up.",
+    system: str = DEFAULT_SYSTEM,
 ):
 
-    with get_local_client() as client:
-        context = find_context(client, question, collection_name)
-        context = format_context(context)
-
-    history = history or []
-    print(get_qa_prompt(history))
-    data = dict(
-        context=context,
-        question=question,
-        history=get_qa_prompt(history),
-        system=system,
-    )
+    context = retrieve_context(question, collection_name)
+
+    prompt = build_prompt(question, context, history=history, system=system)
 
     model = get_model()
 
-    pipeline_template = get_rag_template()
+    for chunk in model.stream(prompt):
+        yield chunk
+
 
-    prompt = pipeline_template.format_prompt(**data)
+def retrieve_context(
+    question: str, collection_name: str, vector: np.ndarray | None = None
+) -> str:
+    with span("retrieval", RETRIEVAL_SECONDS, backend=CONFIG.retrieval_backend):
+        if CONFIG.retrieval_backend == "local":
+            index = get_local_index(collection_name)
+            context = index.find_context(question, CONFIG.context_top_k, vector=vector)
+        else:
+            pool = get_client_pool()
+            with pool.connection(CONFIG.weaviate_acquire_timeout) as client:
+                context = find_context(
+                    client,
+                    question,
+                    collection_name,
+                    CONFIG.context_top_k,
+                    vector=vector,
+                )
+    with span("context_packing", CONTEXT_PACKING_SECONDS):
+        return format_context(context)
+
+
+async def aretrieve_context(
+    question: str, collection_name: str, vector: np.ndarray | None = None
+) -> str:
+    with span("retrieval", RETRIEVAL_SECONDS, backend=CONFIG.retrieval_backend):
+        if CONFIG.retrieval_backend == "local":
+            if vector is None:
+                vector = await get_embedder().aembed_query(question)
+            index = get_local_index(collection_name)
+            context = index.find_context(question, CONFIG.context_top_k, vector=vector)
+        else:
+            pool = get_async_client_pool()
+            async with pool.connection(CONFIG.weaviate_acquire_timeout) as client:
+                context = await afind_context(
+                    client,
+                    question,
+                    collection_name,
+                    CONFIG.context_top_k,
+                    vector=vector,
+                )
+    with span("context_packing", CONTEXT_PACKING_SECONDS):
+        return format_context(context)
+
+
+async def agenerate_answer(
+    question: str,
+    context: str,
+    history: list | None = None,
+    system: str = DEFAULT_SYSTEM,
+) -> AsyncIterator[str]:
+    prompt = build_prompt(question, context, history=history, system=system)
 
-    for chunk in model.stream(prompt):
+    model = get_model()
+
+    async for chunk in model.astream(prompt):
+        yield chunk
+
+
+async def aanswer_question(
+    question: str,
+    collection_name: str = "LHC_Brochure_2021",
+    history: list | None = None,
+    system: str = DEFAULT_SYSTEM,
+) -> AsyncIterator[str]:
+
+    context = await aretrieve_context(question, collection_name)
+
+    async for chunk in agenerate_answer(question, context, history, system):
         yield chunk
 
 
@@ -1,17 +1,76 @@
 import copy
+import threading
 
+from config.conf import CONFIG
+from rag.cache import SummaryCache, get_summary_cache, summary_key
+from rag.concurrency import map_concurrently
 from rag.template import get_table_prompt
 
 
-def get_table_summary(model, table_data: dict) -> dict:
+def with_summary(table_data: dict, summary: str) -> dict:
     table_data = copy.deepcopy(table_data) or {}
-    table_text = table_data["text"]
-    prompt = get_table_prompt(table_text)
-    chat_prompt = model.format_prompt(prompt)
-    summary = model.text_generation(chat_prompt)
     table_data["text"] = summary
     return table_data
 
 
+def get_cached_table_summary(
+    model, table_data: dict, cache: SummaryCache | None
+) -> dict | None:
+    # Looked up before rate limiting and retries, a hit costs no API call
+    if cache is None:
+        return None
+    table_text = table_data["text"]
+    summary = cache.get(summary_key(table_text, get_table_prompt(table_text), model))
+    return with_summary(table_data, summary) if summary is not None else None
+
+
+def get_table_summary(
+    model, table_data: dict, cache: SummaryCache | None = None
+) -> dict:
+    # Always asks the model, see get_cached_table_summary
+    table_text = table_data["text"]
+    prompt = get_table_prompt(table_text)
+    summary = model.text_generation(model.format_prompt(prompt))
+    if cache is not None:
+        cache.put(summary_key(table_text, prompt, model), summary)
+    return with_summary(table_data, summary)
+
+
+def get_table_summaries(
+    model,
+    tables: list[dict],
+    max_workers: int = CONFIG.summary_concurrency,
+    rate_limit: float | None = CONFIG.summary_rate_limit,
+    retries: int = CONFIG.summary_max_retries,
+    cache: SummaryCache | None = None,
+    concurrency: threading.Semaphore | None = None,
+) -> list[dict]:
+    if cache is None:
+        cache = get_summary_cache()
+    summaries = [get_cached_table_summary(model, table, cache) for table in tables]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    generated = map_concurrently(
+        lambda table: get_table_summary(model, table, cache),
+        [tables[i] for i in missing],
+        max_workers=max_workers,
+        rate_limit=rate_limit,
+        retries=retries,
+        backoff=CONFIG.summary_retry_backoff,
+        concurrency=concurrency,
+    )
+
+    for i, summary in zip(missing, generated):
+        if isinstance(summary, Exception):
+            # Keep a failed table as is rather than losing it
+            table = tables[i]
+            print(f"Failed to summarize table {table.get('element_id')}: {summary}")
+            summary = table
+        summaries[i] = summary
+
+    cache.evict()
+    print(f"Summary cache: {cache.stats()}")
+    return summaries
+
+
 def get_image_summary(model, image_path):
     return model.image_to_text(image_path)
@@ -1,4 +1,14 @@
-from weaviate import WeaviateClient
+import re
+
+import numpy as np
+from weaviate import WeaviateAsyncClient, WeaviateClient
+
+from config.conf import CONFIG
+from rag.embedder import get_embedder
+from rag.tokens import count_tokens, truncate_tokens
+
+# Sentence followed by the whitespace that separates it from the next one
+SENTENCE = re.compile(r"\S.*?(?:[.!?](?=\s)|\n|$)\s*", re.DOTALL)
 
 
 def find_context(
@@ -6,12 +16,80 @@ def find_context(
     question: str,
     collection_name: str,
     top_k: int = 3,
+    vector: np.ndarray | None = None,
 ) -> list[str]:
-    response = client.collections.get(collection_name).query.near_text(
-        question, limit=top_k
+    if vector is None:
+        vector = get_embedder().embed_query(question)
+    response = client.collections.get(collection_name).query.near_vector(
+        vector.tolist(), limit=top_k
     )
     return [obj.properties["text"] for obj in response.objects]
 
 
-def format_context(context: list[str]) -> str:
-    return "\n\n".join(context)
+async def afind_context(
+    client: WeaviateAsyncClient,
+    question: str,
+    collection_name: str,
+    top_k: int = 3,
+    vector: np.ndarray | None = None,
+) -> list[str]:
+    if vector is None:
+        vector = await get_embedder().aembed_query(question)
+    response = await client.collections.get(collection_name).query.near_vector(
+        vector.tolist(), limit=top_k
+    )
+    return [obj.properties["text"] for obj in response.objects]
+
+
+def shingles(text: str, size: int = 5) -> set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def pack_context(
+    context: list[str],
+    budget: int | None = CONFIG.context_token_budget,
+    threshold: float = CONFIG.context_dedup_threshold,
+) -> list[str]:
+    # Chunks come most relevant first. By-title chunks repeat each other's
+    # sentences, so a sentence mostly covered by earlier ones is dropped.
+    packed, seen = [], set()
+    remaining = budget if budget is not None else float("inf")
+    for chunk in context:
+        kept, used, truncated = [], 0, False
+        for sentence in SENTENCE.findall(chunk):
+            sentence_shingles = shingles(sentence)
+            if not sentence_shingles:
+                continue
+            overlap = len(sentence_shingles & seen) / len(sentence_shingles)
+            if overlap >= threshold:
+                continue
+            tokens = count_tokens(sentence)
+            if used + tokens > remaining:
+                if not packed and not kept:
+                    # A table chunk may be one long "sentence", better part
+                    # of the best match than no context at all
+                    kept.append(truncate_tokens(sentence, int(remaining)))
+                    used = remaining
+                # Cut on a sentence boundary so the same chunks always give
+                # the same prompt, and stop: later chunks are less relevant
+                truncated = True
+                break
+            kept.append(sentence)
+            used += tokens
+            seen |= sentence_shingles
+
+        if kept:
+            packed.append("".join(kept).strip())
+            remaining -= used
+        if truncated or remaining <= 0:
+            break
+    return packed
+
+
+def format_context(
+    context: list[str], budget: int | None = CONFIG.context_token_budget
+) -> str:
+    return "\n\n".join(pack_context(context, budget))
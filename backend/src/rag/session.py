@@ -0,0 +1,295 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator
+from weakref import WeakValueDictionary
+
+import httpx
+
+from config.conf import CONFIG
+from rag.template import (
+    DEFAULT_SYSTEM,
+    RenderedHistory,
+    build_followup_prompt,
+    build_prompt,
+    get_history_renderer,
+)
+from utils.metrics import TOKEN_BUCKETS, histogram
+from utils.path import PATH
+
+PROMPT_TOKENS = histogram(
+    "rag_prompt_tokens",
+    "Prompt tokens Ollama evaluated, only the new turn for a follow-up",
+    TOKEN_BUCKETS,
+    labels=("kind",),
+)
+
+
+@dataclass
+class ConversationSession:
+    session_id: str
+    history: list[dict] = field(default_factory=list)
+    # Ollama's tokens for the whole conversation so far, from its last reply
+    context: array | None = None
+    # History as rendered into the prompt, so turns are not re-tokenized
+    rendered: RenderedHistory | None = None
+    updated_at: float = field(default_factory=time.time)
+    prompt_tokens: int = 0
+
+    def add_turn(self, question: str, answer: str) -> None:
+        self.history.append({"username": "human", "text": question})
+        self.history.append({"username": "ai", "text": answer})
+        self.rendered = get_history_renderer().render_state(self.history)
+        self.updated_at = time.time()
+
+
+class SessionStore(ABC):
+    def __init__(
+        self,
+        max_entries: int = CONFIG.session_max_entries,
+        ttl: float = CONFIG.session_ttl,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._locks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        # Turns of one conversation are generated one after the other
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def get(self, session_id: str) -> ConversationSession:
+        session = self.load(session_id)
+        if session is None or time.time() - session.updated_at > self.ttl:
+            return ConversationSession(session_id)
+        if session.rendered is not None:
+            get_history_renderer().seed(session.history, session.rendered)
+        return session
+
+    @abstractmethod
+    def load(self, session_id: str) -> ConversationSession | None: ...
+
+    @abstractmethod
+    def save(self, session: ConversationSession) -> None: ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None: ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: OrderedDict[str, ConversationSession] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def load(self, session_id: str) -> ConversationSession | None:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def save(self, session: ConversationSession) -> None:
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    # Survives restarts. History and rendered prefix are stored as zlib
+    # compressed JSON, Ollama's context as packed 32-bit integers.
+    def __init__(self, path: Path, evict_every: int = 100, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.evict_every = evict_every
+        self._saves = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, history BLOB NOT NULL, context BLOB, "
+            "rendered BLOB, prompt_tokens INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM sessions")
+            return row.fetchone()[0]
+
+    def load(self, session_id: str) -> ConversationSession | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT history, context, rendered, prompt_tokens, updated_at "
+                "FROM sessions WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        history, context, rendered, prompt_tokens, updated_at = row
+        if context is not None:
+            context = array("i", context)
+        if rendered is not None:
+            rendered = json.loads(zlib.decompress(rendered))
+            rendered = RenderedHistory(
+                tuple(rendered["tokens"]),
+                rendered["start"],
+                rendered["total"],
+                rendered["text"],
+            )
+        return ConversationSession(
+            session_id,
+            json.loads(zlib.decompress(history)),
+            context,
+            rendered,
+            updated_at,
+            prompt_tokens,
+        )
+
+    def save(self, session: ConversationSession) -> None:
+        rendered = None
+        if session.rendered is not None:
+            rendered = zlib.compress(json.dumps(asdict(session.rendered)).encode())
+        row = (
+            session.session_id,
+            zlib.compress(json.dumps(session.history).encode()),
+            session.context.tobytes() if session.context is not None else None,
+            rendered,
+            session.prompt_tokens,
+            session.updated_at,
+        )
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)", row
+            )
+            self._connection.commit()
+            self._saves += 1
+            if self._saves % self.evict_every == 0:
+                self._evict()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        # Expired sessions, then the least recently used beyond max_entries
+        self._connection.execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+        )
+        self._connection.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            "SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class OllamaSessionGenerator:
+    # Talks to /api/generate directly: the LangChain wrapper drops the
+    # context tokens Ollama returns at the end of each reply
+    def __init__(
+        self,
+        url: str = CONFIG.ollama_url,
+        model: str = CONFIG.chat_model,
+        max_context_tokens: int = CONFIG.session_max_context_tokens,
+    ):
+        self.model = model
+        self.max_context_tokens = max_context_tokens
+        self._client = httpx.AsyncClient(base_url=url, timeout=None)
+
+    def payload(
+        self, session: ConversationSession, question: str, context: str, system: str
+    ) -> dict:
+        payload = {
+            "model": self.model,
+            "stream": True,
+            "keep_alive": CONFIG.ollama_keep_alive,
+            "options": {"num_gpu": 2, "num_thread": 12},
+        }
+        if session.context and len(session.context) <= self.max_context_tokens:
+            # Only the new turn is prefilled, the rest is already in context
+            payload["prompt"] = build_followup_prompt(question, context, self.model)
+            payload["context"] = session.context.tolist()
+        else:
+            # New or too long: start over from system and rendered history,
+            # which keep the same bytes from one turn to the next
+            payload["prompt"] = build_prompt(
+                question, context, session.history, system
+            ).to_string()
+        return payload
+
+    async def agenerate(
+        self,
+        session: ConversationSession,
+        question: str,
+        context: str,
+        system: str = DEFAULT_SYSTEM,
+    ) -> AsyncIterator[str]:
+        # The caller records the turn, see ChatBot.aget_answer
+        payload = self.payload(session, question, context, system)
+        async with self._client.stream(
+            "POST", "/api/generate", json=payload
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                if message.get("response"):
+                    yield message["response"]
+                if message.get("done"):
+                    tokens = message.get("context")
+                    session.context = array("i", tokens) if tokens else None
+                    session.prompt_tokens = message.get("prompt_eval_count", 0)
+                    kind = "followup" if "context" in payload else "full"
+                    PROMPT_TOKENS.observe(session.prompt_tokens, kind=kind)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+session_stores = {
+    "memory": MemorySessionStore,
+    "sqlite": lambda: SQLiteSessionStore(PATH.output / CONFIG.session_store_path),
+}
+
+
+@lru_cache
+def get_session_store() -> SessionStore:
+    return session_stores[CONFIG.session_store]()
+
+
+@lru_cache
+def get_session_generator() -> OllamaSessionGenerator:
+    return OllamaSessionGenerator()
@@ -0,0 +1,112 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+
+def index_path(path: Path) -> Path:
+    return path.with_suffix(".idx.json")
+
+
+def is_complete(path: Path) -> bool:
+    # The index is moved in last, a file without one was never finished
+    return path.exists() and index_path(path).exists()
+
+
+class RecordWriter:
+    # One JSON record per line, plus a {record id: byte offset} index
+    def __init__(self, path: Path, key: Callable[[dict], str | None]):
+        self.path = path
+        self.key = key
+        self.offsets: dict[str, int] = {}
+        self.count = 0
+        self._file = None
+        # Written next to the final files, then moved over them
+        self._partial = path.with_suffix(".partial" + path.suffix)
+
+    def __enter__(self) -> "RecordWriter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._partial, "wb")
+        return self
+
+    def write(self, record: dict[str, Any]) -> None:
+        record_id = self.key(record)
+        if record_id is not None:
+            self.offsets[record_id] = self._file.tell()
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+        self._file.write(line.encode("utf-8") + b"\n")
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._file.close()
+        if exc_type is not None:
+            # The previous file, if any, is left as it was
+            self._partial.unlink(missing_ok=True)
+            return
+        # The count includes records without a key or with a repeated one
+        index = {"count": self.count, "offsets": self.offsets}
+        partial_index = index_path(self._partial)
+        with open(partial_index, "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+        # Drop the old index first: a crash in between leaves no index, never
+        # one pointing into the new records
+        index_path(self.path).unlink(missing_ok=True)
+        os.replace(self._partial, self.path)
+        os.replace(partial_index, index_path(self.path))
+
+
+class RecordReader:
+    def __init__(self, path: Path):
+        self.path = path
+        self._offsets: dict[str, int] | None = None
+        self._count: int | None = None
+
+    @property
+    def offsets(self) -> dict[str, int]:
+        if self._offsets is None:
+            self._load_index()
+        return self._offsets
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        with open(self.path, "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def __len__(self) -> int:
+        if self._offsets is None:
+            self._load_index()
+        if self._count is None:
+            with open(self.path, "rb") as f:
+                self._count = sum(1 for _ in f)
+        return self._count
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.offsets
+
+    def _load_index(self) -> None:
+        with open(index_path(self.path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if "offsets" in index and "count" in index:
+            self._offsets, self._count = index["offsets"], index["count"]
+        else:
+            # Older index files only hold the offsets, records get counted
+            self._offsets = index
+
+    def get(self, record_id: str) -> dict[str, Any] | None:
+        offset = self.offsets.get(record_id)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+
+def write_records(
+    path: Path,
+    records: Iterable[dict[str, Any]],
+    key: Callable[[dict], str | None],
+) -> int:
+    with RecordWriter(path, key) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.count
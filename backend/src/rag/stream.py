@@ -0,0 +1,298 @@
+import argparse
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from config.conf import CONFIG
+from rag.cache import SummaryCache, get_summary_cache
+from rag.client import get_client_pool
+from rag.concurrency import TokenBucket, retry
+from rag.embedder import get_ingest_embedder
+from rag.model import Cohere
+from rag.parse import partition_file
+from rag.preprocess import get_cached_table_summary, get_table_summary
+from rag.store import RecordWriter
+from rag.vector import DocsWithRefsBatch, create_reference_and_collection
+from utils.metrics import histogram
+from utils.path import PATH
+
+STREAM_ITEM_SECONDS = histogram(
+    "ingest_stream_item_seconds",
+    "Time a streaming ingestion stage spends on one item",
+    labels=("stage",),
+)
+
+_DONE = object()
+
+# element type -> record kind, everything else is dropped
+KINDS = {"Table": "tables", "CompositeElement": "texts"}
+
+
+@dataclass
+class Stage:
+    name: str
+    # Returns the items to pass on, so a stage can drop, keep or fan out
+    fn: Callable[[Any], Iterable[Any]]
+    workers: int = 1
+    queue_size: int = CONFIG.stream_queue_size
+    processed: int = 0
+    failed: int = 0
+    busy: float = 0.0
+    max_depth: int = 0
+    inbox: queue.Queue = field(init=False, repr=False)
+    _running: int = field(init=False, repr=False)
+    _depth_total: int = field(init=False, default=0, repr=False)
+    _depth_samples: int = field(init=False, default=0, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.inbox = queue.Queue(self.queue_size)
+        self._running = self.workers
+        self._lock = threading.Lock()
+
+    def put(self, item: Any) -> None:
+        # Blocks when the stage is behind, which slows down the one feeding it
+        self.inbox.put(item)
+        depth = self.inbox.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    def stats(self) -> dict[str, float]:
+        samples = self._depth_samples or 1
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy": round(self.busy, 2),
+            "depth": self.inbox.qsize(),
+            "max_depth": self.max_depth,
+            "mean_depth": round(self._depth_total / samples, 2),
+        }
+
+
+class StreamingPipeline:
+    def __init__(self, stages: list[Stage], report_interval: float = 0.0):
+        self.stages = stages
+        self.report_interval = report_interval
+        self.errors: list[tuple[str, Exception]] = []
+
+    def run(self, items: Iterable[Any]) -> dict[str, dict]:
+        threads = [
+            threading.Thread(target=self._work, args=(i,), daemon=True)
+            for i, stage in enumerate(self.stages)
+            for _ in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        stop = threading.Event()
+        reporter = None
+        if self.report_interval:
+            reporter = threading.Thread(target=self._report, args=(stop,), daemon=True)
+            reporter.start()
+
+        first = self.stages[0]
+        for item in items:
+            first.put(item)
+        for _ in range(first.workers):
+            first.inbox.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        stop.set()
+        if reporter is not None:
+            reporter.join()
+        return self.stats()
+
+    def stats(self) -> dict[str, dict]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def report(self) -> str:
+        lines = [
+            f"{'stage':<10} {'done':>6} {'failed':>6} {'busy s':>8} "
+            f"{'depth':>6} {'max':>5} {'mean':>6}"
+        ]
+        for name, stats in self.stats().items():
+            lines.append(
+                f"{name:<10} {stats['processed']:>6} {stats['failed']:>6} "
+                f"{stats['busy']:>8.1f} {stats['depth']:>6} "
+                f"{stats['max_depth']:>5} {stats['mean_depth']:>6.1f}"
+            )
+        return "\n".join(lines)
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.inbox.get()
+            if item is _DONE:
+                break
+            # Outputs are passed on as they come, so a stage that fans out
+            # (a whole document into elements) never holds all of them.
+            # Time blocked on the next stage's queue is not counted as busy.
+            busy, waiting, ok = time.perf_counter(), 0.0, True
+            try:
+                for output in stage.fn(item):
+                    if following is not None:
+                        blocked = time.perf_counter()
+                        following.put(output)
+                        waiting += time.perf_counter() - blocked
+            except Exception as e:
+                print(f"Stage {stage.name} failed: {e}")
+                self.errors.append((stage.name, e))
+                ok = False
+            seconds = time.perf_counter() - busy - waiting
+            STREAM_ITEM_SECONDS.observe(seconds, stage=stage.name)
+            with stage._lock:
+                if ok:
+                    stage.processed += 1
+                else:
+                    stage.failed += 1
+                stage.busy += seconds
+
+        # The last worker out closes the next stage
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last and following is not None:
+            for _ in range(following.workers):
+                following.inbox.put(_DONE)
+
+    def _report(self, stop: threading.Event) -> None:
+        while not stop.wait(self.report_interval):
+            depths = ", ".join(
+                f"{stage.name}={stage.inbox.qsize()}" for stage in self.stages
+            )
+            print(f"Queue depths: {depths}")
+
+
+def stream_file(
+    filepath: Path,
+    collection_name: str,
+    model=None,
+    cache: SummaryCache | None = None,
+    incremental: bool = False,
+    report_interval: float = CONFIG.stream_report_interval,
+    concurrency: threading.Semaphore | None = None,
+) -> StreamingPipeline:
+    model = model or Cohere()
+    if cache is None:
+        cache = get_summary_cache()
+    reference_name = f"Originals_{collection_name}"
+    processed_file = PATH.output / filepath.stem / "processed.jsonl"
+    rate_limiter = (
+        TokenBucket(CONFIG.summary_rate_limit) if CONFIG.summary_rate_limit else None
+    )
+    unsummarized = []
+
+    def partition(path: Path) -> Iterable[dict]:
+        return partition_file(path, concurrency=concurrency)
+
+    def select(element: dict) -> Iterable[dict]:
+        kind = KINDS.get(element["type"])
+        if kind is not None:
+            yield {"kind": kind, "original": element, "processed": element}
+
+    def summarize(record: dict) -> Iterable[dict]:
+        if record["kind"] == "tables":
+            cached = get_cached_table_summary(model, record["original"], cache)
+            if cached is not None:
+                record["processed"] = cached
+            else:
+                try:
+                    record["processed"] = retry(
+                        lambda: get_table_summary(model, record["original"], cache),
+                        retries=CONFIG.summary_max_retries,
+                        backoff=CONFIG.summary_retry_backoff,
+                        rate_limiter=rate_limiter,
+                        concurrency=concurrency,
+                    )
+                except Exception as e:
+                    # Keep a failed table as is rather than losing it
+                    element_id = record["original"].get("element_id")
+                    print(f"Failed to summarize table {element_id}: {e}")
+                    unsummarized.append(element_id)
+        yield record
+
+    embedder = get_ingest_embedder()
+
+    with get_client_pool().connection() as client:
+        create_reference_and_collection(
+            client,
+            collection_name,
+            reference_name,
+            delete_if_exists=not incremental,
+            external_vectors=embedder is not None,
+        )
+        writer = RecordWriter(
+            processed_file, key=lambda record: record["original"].get("element_id")
+        )
+        batch = DocsWithRefsBatch(
+            client, collection_name, reference_name, embedder=embedder
+        )
+        with writer, batch:
+
+            def insert(record: dict) -> Iterable[dict]:
+                writer.write(record)
+                batch.add(record["original"], record["processed"])
+                return ()
+
+            pipeline = StreamingPipeline(
+                [
+                    Stage("partition", partition),
+                    Stage("select", select),
+                    Stage("summarize", summarize, workers=CONFIG.summary_concurrency),
+                    # The client batch and the writer are not thread-safe
+                    Stage("insert", insert),
+                ],
+                report_interval=report_interval,
+            )
+            pipeline.run([filepath])
+            if pipeline.errors:
+                # Raised inside the writer, so no processed file is left and
+                # no stage is checkpointed: the next run starts the file over
+                stages = ", ".join(sorted({name for name, _ in pipeline.errors}))
+                raise RuntimeError(
+                    f"{len(pipeline.errors)} failures in {stages} "
+                    f"while streaming {filepath.name}"
+                )
+            if not writer.count:
+                # Leaves no processed file behind, the next run starts over
+                raise RuntimeError(f"No elements ingested from {filepath.name}")
+
+        if incremental:
+            deleted = batch.prune()
+            print(f"Deleted {deleted} elements no longer in {filepath.name}")
+
+    for failed in batch.failed_objects:
+        print(f"Failed to insert {failed.object_.uuid}: {failed.message}")
+    if unsummarized:
+        print(f"{len(unsummarized)} tables kept without a summary")
+    cache.evict()
+    return pipeline
+
+
+if __name__ == "__main__":
+    from rag.ingest import collection_name_for
+
+    parser = argparse.ArgumentParser(description="Stream a PDF into Weaviate")
+    parser.add_argument("filename")
+    parser.add_argument("--collection-name")
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args()
+
+    filepath = PATH.resources / args.filename
+    collection_name = args.collection_name or collection_name_for(filepath)
+
+    start = time.perf_counter()
+    try:
+        pipeline = stream_file(filepath, collection_name, incremental=args.incremental)
+    finally:
+        get_client_pool().close()
+
+    print(pipeline.report())
+    print(f"Streamed {filepath.name} in {time.perf_counter() - start:.1f}s")
@@ -1,3 +1,11 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from langchain_core.prompt_values import PromptValue
 from langchain_core.prompts import (
     PromptTemplate,
     PipelinePromptTemplate,
@@ -5,13 +13,35 @@ from langchain_core.prompts import (
 )
 from utils.path import PATH
 from config.conf import CONFIG
+from rag.tokens import count_tokens
+from utils.metrics import TOKEN_BUCKETS, histogram, span
+
+PROMPT_BUILD_SECONDS = histogram(
+    "rag_prompt_build_seconds", "Time to render the prompt", labels=("kind",)
+)
+HISTORY_TOKENS = histogram(
+    "rag_history_tokens", "Tokens of conversation history in the prompt", TOKEN_BUCKETS
+)
+
+
+# path -> (mtime, template), re-read only when the file changes on disk
+_templates: dict[Path, tuple[int, PromptTemplate]] = {}
+_rag_templates: dict[str, tuple[tuple[int, ...], PipelinePromptTemplate]] = {}
 
 
 def get_template(template_name: str) -> PromptTemplate:
-    with open(PATH.prompts / template_name, "r") as f:
+    path = PATH.prompts / template_name
+    mtime = path.stat().st_mtime_ns
+    cached = _templates.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "r") as f:
         template = f.read()
 
-    return PromptTemplate.from_template(template)
+    template = PromptTemplate.from_template(template)
+    _templates[path] = (mtime, template)
+    return template
 
 
 def get_prompt(
@@ -46,22 +76,180 @@ def get_table_prompt(table_text: str) -> list[dict]:
 #     return messages
 
 
-def get_qa_prompt(history: list[dict]):
-    # return ChatPromptTemplate.from_messages(
-    #     [(entry["username"], entry["text"]) for entry in history]
-    # )
-    return "\n\n".join([f"{entry['username']}: {entry['text']}" for entry in history])
+def render_turn(entry: dict) -> str:
+    return f"{entry['username']}: {entry['text']}"
+
+
+def prefix_digests(turns: list[str]) -> list[str]:
+    # digests[i] identifies the conversation up to and including turns[i]
+    digest = hashlib.sha256()
+    digests = []
+    for turn in turns:
+        digest.update(turn.encode("utf-8") + b"\0")
+        digests.append(digest.copy().hexdigest())
+    return digests
+
+
+@dataclass(frozen=True)
+class RenderedHistory:
+    tokens: tuple[int, ...]
+    # First turn still in the prompt, older ones were dropped
+    start: int
+    total: int
+    text: str
+
+
+class HistoryRenderer:
+    def __init__(
+        self,
+        budget: int = CONFIG.history_token_budget,
+        drop_block: int = CONFIG.history_drop_block,
+        max_size: int = CONFIG.history_cache_size,
+    ):
+        self.budget = budget
+        self.drop_block = max(1, drop_block)
+        self.max_size = max_size
+        self._cache: OrderedDict[str, RenderedHistory] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, history: list[dict]) -> str:
+        state = self.render_state(history)
+        return state.text if state is not None else ""
+
+    def seed(self, history: list[dict], state: RenderedHistory) -> None:
+        # A session restored from disk skips re-counting its turns
+        turns = [render_turn(entry) for entry in history]
+        if turns and len(state.tokens) == len(turns):
+            self._put(prefix_digests(turns)[-1], state)
+
+    def render_state(self, history: list[dict]) -> RenderedHistory | None:
+        turns = [render_turn(entry) for entry in history]
+        if not turns:
+            return None
+
+        # The client resends the whole conversation, pick up the longest
+        # prefix rendered before and only count the turns added since
+        digests = prefix_digests(turns)
+        state, cached = None, 0
+        with self._lock:
+            for n in range(len(turns), 0, -1):
+                state = self._cache.get(digests[n - 1])
+                if state is not None:
+                    self._cache.move_to_end(digests[n - 1])
+                    cached = n
+                    break
+        if cached == len(turns):
+            return state
+
+        tokens = list(state.tokens) if state else []
+        start = state.start if state else 0
+        total = state.total if state else 0
+        for turn in turns[cached:]:
+            tokens.append(count_tokens(turn))
+            total += tokens[-1]
+
+        # Drop whole blocks of the oldest turns, so the rendered prefix stays
+        # the same for several turns instead of shifting on every request
+        dropped = False
+        while total > self.budget and start < len(turns) - 1:
+            end = min(start + self.drop_block, len(turns) - 1)
+            total -= sum(tokens[start:end])
+            start, dropped = end, True
+
+        if state is None or dropped:
+            text = self._join(turns, start)
+        else:
+            text = "\n\n".join([state.text, *turns[cached:]])
+
+        state = RenderedHistory(tuple(tokens), start, total, text)
+        self._put(digests[-1], state)
+        return state
+
+    def _put(self, digest: str, state: RenderedHistory) -> None:
+        with self._lock:
+            self._cache[digest] = state
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _join(turns: list[str], start: int) -> str:
+        kept = turns[start:]
+        if start:
+            kept = [f"({start} earlier messages omitted)", *kept]
+        return "\n\n".join(kept)
+
+
+@lru_cache
+def get_history_renderer() -> HistoryRenderer:
+    return HistoryRenderer()
+
+
+def get_qa_prompt(history: list[dict]) -> str:
+    # Recent turns verbatim, within CONFIG.history_token_budget tokens
+    state = get_history_renderer().render_state(history)
+    if state is None:
+        return ""
+    # Already counted turn by turn while rendering
+    HISTORY_TOKENS.observe(state.total)
+    return state.text
 
 
 def get_rag_template(model_name: str = CONFIG.chat_model) -> PipelinePromptTemplate:
-    model_template = get_template(f"{model_name.replace(':','_')}.txt")
+    model_file = f"{model_name.replace(':','_')}.txt"
+    model_template = get_template(model_file)
     prompt_template = get_template("qa.txt")
 
+    # Rebuilt only when one of the two templates changed on disk
+    key = tuple(_templates[PATH.prompts / name][0] for name in (model_file, "qa.txt"))
+    cached = _rag_templates.get(model_name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
     pipeline_prompts = [
         ("prompt", prompt_template),
     ]
 
-    return PipelinePromptTemplate(
+    template = PipelinePromptTemplate(
         pipeline_prompts=pipeline_prompts,
         final_prompt=model_template,
     )
+    _rag_templates[model_name] = (key, template)
+    return template
+
+
+DEFAULT_SYSTEM = "You are an assistant tasked with answering questions. Use the context provided, just answer the question straight up."
+
+
+def build_prompt(
+    question: str,
+    context: str,
+    history: list | None = None,
+    system: str = DEFAULT_SYSTEM,
+) -> PromptValue:
+    with span("prompt_build", PROMPT_BUILD_SECONDS, kind="full"):
+        history = get_qa_prompt(history or [])
+        data = dict(
+            context=context,
+            question=question,
+            history=history,
+            system=system,
+        )
+
+        pipeline_template = get_rag_template()
+
+        prompt = pipeline_template.format_prompt(**data)
+    return prompt
+
+
+def build_followup_prompt(
+    question: str, context: str, model_name: str = CONFIG.chat_model
+) -> str:
+    # System and history are already in the conversation Ollama continues
+    with span("prompt_build", PROMPT_BUILD_SECONDS, kind="followup"):
+        model_template = get_template(f"{model_name.replace(':','_')}.txt")
+        prompt = get_template("qa_followup.txt").format(
+            context=context, question=question
+        )
+        prompt = model_template.format(system="", prompt=prompt)
+    return prompt
@@ -0,0 +1,43 @@
+import logging
+import math
+from functools import lru_cache
+
+from config.conf import CONFIG
+from utils.tokens import HF_API_KEY
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_tokenizer():
+    # Ollama does not expose its tokenizer, use the matching Hugging Face one.
+    # The first call may download it, keep it off the event loop.
+    if not CONFIG.chat_tokenizer:
+        return None
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(CONFIG.chat_tokenizer, token=HF_API_KEY)
+    except (ImportError, OSError) as e:
+        logger.warning("Using approximate token counts, no tokenizer: %s", e)
+        return None
+
+
+def approximate_tokens(text: str) -> int:
+    # About four characters per token for English with these vocabularies
+    return math.ceil(len(text) / 4)
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return approximate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[: max(0, budget) * 4]
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    return tokenizer.decode(ids[: max(0, budget)])
@@ -1,15 +1,19 @@
 from contextlib import contextmanager
-from typing import Any, Type
+from typing import Any, Iterable, Type
 
 import weaviate
 from weaviate import WeaviateClient
 from weaviate.collections import Collection
+from weaviate.collections.classes.batch import ErrorObject
 import weaviate.classes as wvc
 import weaviate.classes.config as wvcc
 from rag.schema import Schema, Element
 from uuid import UUID
 from config.conf import CONFIG
+from rag.embedder import Embedder
 from weaviate.util import generate_uuid5
+from weaviate.classes.query import Filter, QueryReference
+from dataclasses import dataclass, field
 
 
 @contextmanager
@@ -59,6 +63,7 @@ def create_collection(
     skip_vectorization: bool = False,
     delete_if_exists: bool = False,
     references: dict[str, str] | None = None,
+    external_vectors: bool = False,
 ) -> Collection:
 
     if collection_name in client.collections.list_all():
@@ -76,9 +81,10 @@ def create_collection(
 
     properties = schema2property(schema)
 
+    # External vectors are passed with each object on insert
     vectorizer = (
         None
-        if skip_vectorization
+        if skip_vectorization or external_vectors
         else wvcc.Configure.Vectorizer.text2vec_transformers(
             inference_url=CONFIG.inference_url
         )
@@ -99,6 +105,7 @@ def create_vectorized_collection(
     schema: Type[Schema],
     delete_if_exists: bool = False,
     references: dict[str, str] | None = None,
+    external_vectors: bool = False,
 ) -> Collection:
     return create_collection(
         client,
@@ -107,6 +114,7 @@ def create_vectorized_collection(
         skip_vectorization=False,
         delete_if_exists=delete_if_exists,
         references=references,
+        external_vectors=external_vectors,
     )
 
 
@@ -128,10 +136,17 @@ def create_raw_collection(
 
 
 def create_reference_and_collection(
-    client: WeaviateClient, collection_name: str, reference_name: str
+    client: WeaviateClient,
+    collection_name: str,
+    reference_name: str,
+    delete_if_exists: bool = True,
+    external_vectors: bool = False,
 ):
     create_raw_collection(
-        client, schema=Element, collection_name=reference_name, delete_if_exists=True
+        client,
+        schema=Element,
+        collection_name=reference_name,
+        delete_if_exists=delete_if_exists,
     )
 
     create_vectorized_collection(
@@ -139,7 +154,8 @@ def create_reference_and_collection(
         schema=Element,
         collection_name=collection_name,
         references={"from": reference_name},
-        delete_if_exists=True,
+        delete_if_exists=delete_if_exists,
+        external_vectors=external_vectors,
     )
 
 
@@ -148,6 +164,7 @@ def add_document(
     collection_name: str,
     document: dict | Schema,
     references: dict[str, UUID] | None = None,
+    vector: list[float] | None = None,
 ) -> UUID:
     if isinstance(document, Schema):
         document = document.model_dump()
@@ -156,12 +173,17 @@ def add_document(
 
     collection = client.collections.get(collection_name)
     return collection.data.insert(
-        document, references=references, uuid=generate_uuid5(document)
+        document, references=references, uuid=generate_uuid5(document), vector=vector
     )
 
 
 def add_doc_with_ref(
-    client, collection_name: str, reference_name: str, reference: dict, document: dict
+    client,
+    collection_name: str,
+    reference_name: str,
+    reference: dict,
+    document: dict,
+    embedder: Embedder | None = None,
 ):
     reference_id = add_document(
         client,
@@ -175,6 +197,7 @@ def add_doc_with_ref(
         collection_name=collection_name,
         document=document,
         references={"from": reference_id},
+        vector=embed_documents(embedder, [document])[0] if embedder else None,
     )
 
 
@@ -195,3 +218,288 @@ def add_documents(
             )
             # obj = wvc.data.DataObject(properties=properties, references=references)
             batch.add_object(properties=properties, references=references)
+
+
+def to_properties(document: dict[str, Any] | Schema) -> dict[str, Any]:
+    return document.model_dump() if isinstance(document, Schema) else document
+
+
+def embed_documents(embedder: Embedder, documents: list[dict]) -> list[list[float]]:
+    # Same text Weaviate would vectorize, see Schema.__vectorized__
+    vectors = embedder.embed([document["text"] for document in documents])
+    return vectors.tolist()
+
+
+def prepare_docs_with_refs(
+    pairs: Iterable[tuple[dict[str, Any] | Schema, dict[str, Any] | Schema]],
+) -> tuple[dict[str, dict], dict[str, tuple[dict, str]]]:
+    references = {}
+    documents = {}
+    for reference, document in pairs:
+        reference = to_properties(reference)
+        document = to_properties(document)
+        reference_id = generate_uuid5(reference)
+        references[reference_id] = reference
+        documents[generate_uuid5(document)] = (document, reference_id)
+    return references, documents
+
+
+def insert_references(
+    collection: Collection, references: dict[str, dict], batch_size: int = 100
+) -> list[ErrorObject]:
+    with collection.batch.fixed_size(batch_size) as batch:
+        for reference_id, reference in references.items():
+            batch.add_object(properties=reference, uuid=reference_id)
+    return list(collection.batch.failed_objects)
+
+
+def insert_documents(
+    collection: Collection,
+    documents: dict[str, tuple[dict, str]],
+    failed_references: list[ErrorObject] | None = None,
+    batch_size: int = 100,
+    embedder: Embedder | None = None,
+) -> list[ErrorObject]:
+    # Never point at an original that failed to load.
+    failed_ids = {str(obj.object_.uuid) for obj in failed_references or []}
+    entries = [
+        (document_id, document, reference_id)
+        for document_id, (document, reference_id) in documents.items()
+        if reference_id not in failed_ids
+    ]
+
+    with collection.batch.fixed_size(batch_size) as batch:
+        for start in range(0, len(entries), batch_size):
+            chunk = entries[start : start + batch_size]
+            vectors = (
+                embed_documents(embedder, [document for _, document, _ in chunk])
+                if embedder
+                else [None] * len(chunk)
+            )
+            for (document_id, document, reference_id), vector in zip(chunk, vectors):
+                batch.add_object(
+                    properties=document,
+                    uuid=document_id,
+                    references={"from": reference_id},
+                    vector=vector,
+                )
+    return list(collection.batch.failed_objects)
+
+
+class DocsWithRefsBatch:
+    # Only IDs are kept, so pairs can be streamed from disk
+    def __init__(
+        self,
+        client: WeaviateClient,
+        collection_name: str,
+        reference_name: str,
+        batch_size: int = 100,
+        embedder: Embedder | None = None,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.reference_name = reference_name
+        self.batch_size = batch_size
+        self.embedder = embedder
+        self.failed_objects: list[ErrorObject] = []
+        self._documents_by_reference: dict[str, list[str]] = {}
+        # Documents waiting to be embedded together, with their reference
+        self._pending: list[tuple[dict, dict]] = []
+        self._context = None
+        self._batch = None
+
+    def __enter__(self) -> "DocsWithRefsBatch":
+        self._context = self.client.batch.fixed_size(self.batch_size)
+        self._batch = self._context.__enter__()
+        return self
+
+    def add(
+        self, reference: dict[str, Any] | Schema, document: dict[str, Any] | Schema
+    ) -> None:
+        reference = to_properties(reference)
+        document = to_properties(document)
+        if self.embedder is None:
+            self._add(reference, document)
+            return
+
+        self._pending.append((reference, document))
+        if len(self._pending) >= CONFIG.ingest_embedding_batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        vectors = embed_documents(self.embedder, [document for _, document in pending])
+        for (reference, document), vector in zip(pending, vectors):
+            self._add(reference, document, vector)
+
+    def _add(
+        self, reference: dict, document: dict, vector: list[float] | None = None
+    ) -> None:
+        reference_id = generate_uuid5(reference)
+        document_id = generate_uuid5(document)
+
+        # Each original is queued just ahead of the object that references it
+        if reference_id not in self._documents_by_reference:
+            self._batch.add_object(
+                collection=self.reference_name,
+                properties=reference,
+                uuid=reference_id,
+            )
+        self._batch.add_object(
+            collection=self.collection_name,
+            properties=document,
+            uuid=document_id,
+            references={"from": reference_id},
+            vector=vector,
+        )
+        self._documents_by_reference.setdefault(reference_id, []).append(document_id)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+        self._context.__exit__(exc_type, exc, tb)
+        self.failed_objects = list(self.client.batch.failed_objects)
+
+        # Never leave objects pointing at an original that failed to load.
+        dangling = [
+            document_id
+            for failed in self.failed_objects
+            if failed.object_.collection == self.reference_name
+            for document_id in self._documents_by_reference.get(
+                str(failed.object_.uuid), []
+            )
+        ]
+        delete_by_ids(self.client.collections.get(self.collection_name), dangling)
+
+    def prune(self) -> int:
+        # Objects are upserted by content id, so whatever this batch did not
+        # write has disappeared from the source and must not be found again
+        documents = {
+            document_id
+            for document_ids in self._documents_by_reference.values()
+            for document_id in document_ids
+        }
+        deleted = delete_unlisted(
+            self.client.collections.get(self.collection_name), documents
+        )
+        delete_unlisted(
+            self.client.collections.get(self.reference_name),
+            set(self._documents_by_reference),
+        )
+        return deleted
+
+
+def add_docs_with_refs(
+    client: WeaviateClient,
+    collection_name: str,
+    reference_name: str,
+    pairs: Iterable[tuple[dict[str, Any] | Schema, dict[str, Any] | Schema]],
+    batch_size: int = 100,
+    embedder: Embedder | None = None,
+) -> list[ErrorObject]:
+    with DocsWithRefsBatch(
+        client, collection_name, reference_name, batch_size, embedder
+    ) as batch:
+        for reference, document in pairs:
+            batch.add(reference, document)
+
+    return batch.failed_objects
+
+
+@dataclass
+class SyncReport:
+    inserted: int = 0
+    relinked: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    failed_objects: list[ErrorObject] = field(default_factory=list)
+
+
+def delete_by_ids(collection: Collection, ids: list[str], chunk_size: int = 1000):
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start : start + chunk_size]
+        collection.data.delete_many(where=Filter.by_id().contains_any(chunk))
+
+
+def delete_unlisted(collection: Collection, keep: set[str]) -> int:
+    vanished = [
+        str(obj.uuid)
+        for obj in collection.iterator(return_properties=[])
+        if str(obj.uuid) not in keep
+    ]
+    delete_by_ids(collection, vanished)
+    return len(vanished)
+
+
+def sync_docs_with_refs(
+    client: WeaviateClient,
+    collection_name: str,
+    reference_name: str,
+    pairs: Iterable[tuple[dict[str, Any] | Schema, dict[str, Any] | Schema]],
+    batch_size: int = 100,
+    embedder: Embedder | None = None,
+) -> SyncReport:
+    references, documents = prepare_docs_with_refs(pairs)
+
+    reference_collection = client.collections.get(reference_name)
+    collection = client.collections.get(collection_name)
+
+    stored_references = {
+        str(obj.uuid) for obj in reference_collection.iterator(return_properties=[])
+    }
+    stored_documents = {}
+    for obj in collection.iterator(
+        return_properties=[],
+        return_references=QueryReference(link_on="from", return_properties=[]),
+    ):
+        targets = (obj.references or {}).get("from")
+        target = targets.objects[0].uuid if targets and targets.objects else None
+        stored_documents[str(obj.uuid)] = str(target) if target else None
+
+    report = SyncReport()
+
+    # Insert before deleting so the collection never goes empty while serving.
+    new_references = {
+        reference_id: reference
+        for reference_id, reference in references.items()
+        if reference_id not in stored_references
+    }
+    report.failed_objects += insert_references(
+        reference_collection, new_references, batch_size
+    )
+
+    new_documents = {
+        document_id: entry
+        for document_id, entry in documents.items()
+        if document_id not in stored_documents
+    }
+    report.failed_objects += insert_documents(
+        collection, new_documents, report.failed_objects, batch_size, embedder
+    )
+    report.inserted = len(new_documents)
+
+    # Same content now summarizing a different original: move the reference.
+    for document_id, (_, reference_id) in documents.items():
+        if document_id in new_documents:
+            continue
+        if stored_documents[document_id] != reference_id:
+            collection.data.reference_replace(
+                from_uuid=document_id, from_property="from", to=reference_id
+            )
+            report.relinked += 1
+        else:
+            report.unchanged += 1
+
+    vanished_documents = [
+        document_id for document_id in stored_documents if document_id not in documents
+    ]
+    delete_by_ids(collection, vanished_documents)
+    delete_by_ids(
+        reference_collection,
+        [ref_id for ref_id in stored_references if ref_id not in references],
+    )
+    report.deleted = len(vanished_documents)
+
+    return report
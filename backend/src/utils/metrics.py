@@ -0,0 +1,222 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind: str
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self.samples()
+
+    def samples(self) -> list[str]: ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Gauge(Metric):
+    # Read when scraped, so the hot path pays nothing
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {format_value(self.read())}"]
+
+
+@dataclass
+class HistogramValues:
+    counts: list[int]
+    total: float = 0.0
+    count: int = 0
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        labels: tuple[str, ...] = (),
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: dict[tuple[str, ...], HistogramValues] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        # Counts per bucket, made cumulative only when scraped
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = HistogramValues([0] * len(self.buckets))
+            values.counts[index] += 1
+            values.total += value
+            values.count += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = {
+                key: HistogramValues(list(v.counts), v.total, v.count)
+                for key, v in self._values.items()
+            }
+        lines = []
+        for key, value in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, value.counts):
+                cumulative += count
+                labels = format_labels(
+                    self.labels + ("le",), key + (format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(value.total)}")
+            lines.append(f"{self.name}_count{labels} {value.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # Modules can be imported twice, keep the first instance
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def histogram(
+    name: str,
+    help: str,
+    buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    labels: tuple[str, ...] = (),
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, buckets, labels))
+
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, read: Callable[[], float]) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, read))
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    start: float = field(default_factory=time.perf_counter)
+    # (name, offset from the start of the trace, duration), in seconds
+    spans: list[tuple[str, float, float]] = field(default_factory=list)
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        self.spans.append((name, start - self.start, duration))
+
+    def report(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "spans": [
+                {"name": name, "start": round(start, 6), "duration": round(d, 6)}
+                for name, start, d in self.spans
+            ],
+        }
+
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+def start_trace(trace_id: str) -> Trace:
+    trace = Trace(trace_id)
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+
+@contextmanager
+def span(name: str, metric: Histogram | None = None, **labels) -> Iterator[None]:
+    # Feeds the histogram always, the trace only when one is being recorded
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        if metric is not None:
+            metric.observe(duration, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, start, duration)
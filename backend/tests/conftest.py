@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+# Modules import each other from the source root, as with PYTHONPATH=src
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from config.conf import CONFIG  # noqa: E402
+
+# Approximate token counts, nothing to download
+CONFIG.chat_tokenizer = ""
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from api.services.admission import AdmissionController, AdmissionRejected
+
+
+def test_full_queue_rejected():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, max_wait=5)
+        ticket = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.reason == "queue full"
+        assert rejected.value.retry_after >= 1
+
+        ticket.release()
+        (await waiter).release()
+        assert controller.in_flight == 0
+        assert controller.rejected == 1
+
+    asyncio.run(run())
+
+
+def test_wait_limit_rejected():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, max_wait=0.05)
+        ticket = await controller.acquire()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.reason == "queue wait limit"
+
+        ticket.release()
+        assert controller.in_flight == 0
+        assert controller.timed_out == 1
+
+    asyncio.run(run())
+
+
+def test_priority_served_first():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, max_wait=5)
+        ticket = await controller.acquire()
+        order = []
+
+        async def wait(priority: int):
+            (await controller.acquire(priority)).release()
+            order.append(priority)
+
+        waiters = [asyncio.create_task(wait(1)), asyncio.create_task(wait(0))]
+        await asyncio.sleep(0)
+        ticket.release()
+        await asyncio.gather(*waiters)
+
+        assert order == [0, 1]
+
+    asyncio.run(run())
+
+
+def test_release_counts_once():
+    async def run():
+        controller = AdmissionController(max_in_flight=2)
+        ticket = await controller.acquire()
+        ticket.release()
+        ticket.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
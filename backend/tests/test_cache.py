@@ -0,0 +1,43 @@
+import numpy as np
+
+from api.services.cache import SemanticCache, context_digest
+
+
+def test_similar_question_hits():
+    cache = SemanticCache(threshold=0.9, max_size=4, ttl=60)
+    cache.store(np.array([1.0, 0.0]), "LHC", "digest", ["The answer."])
+
+    assert cache.lookup(np.array([0.99, 0.05]), "LHC", "digest") == ["The answer."]
+    assert cache.lookup(np.array([0.0, 1.0]), "LHC", "digest") is None
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_other_context_misses():
+    cache = SemanticCache(threshold=0.9, max_size=4, ttl=60)
+    cache.store(np.array([1.0, 0.0]), "LHC", "digest", ["The answer."])
+
+    assert cache.lookup(np.array([1.0, 0.0]), "LHC", "other") is None
+    assert cache.lookup(np.array([1.0, 0.0]), "Other", "digest") is None
+
+
+def test_expired_entry_misses():
+    cache = SemanticCache(threshold=0.9, max_size=4, ttl=0)
+    cache.store(np.array([1.0, 0.0]), "LHC", "digest", ["The answer."])
+
+    assert cache.lookup(np.array([1.0, 0.0]), "LHC", "digest") is None
+    assert len(cache) == 0
+
+
+def test_oldest_entry_evicted():
+    cache = SemanticCache(threshold=0.9, max_size=2, ttl=60)
+    for i, vector in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+        cache.store(np.array(vector), "LHC", "digest", [str(i)])
+
+    assert len(cache) == 2
+    assert cache.lookup(np.array([1.0, 0.0]), "LHC", "digest") is None
+    assert cache.lookup(np.array([-1.0, 0.0]), "LHC", "digest") == ["2"]
+
+
+def test_digest_depends_on_history():
+    history = [{"username": "human", "text": "What is CERN?"}]
+    assert context_digest("context") != context_digest("context", history)
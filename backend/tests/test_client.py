@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+
+from rag.client import AsyncClientPool, ClientPool
+
+
+class FakeClient:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def is_ready(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeAsyncClient(FakeClient):
+    async def is_ready(self) -> bool:
+        return True
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def sync_pool(size: int = 1) -> ClientPool:
+    pool = ClientPool(size=size, health_check_interval=0)
+    pool._connect = FakeClient
+    return pool
+
+
+def async_pool(size: int = 1) -> AsyncClientPool:
+    async def connect():
+        return FakeAsyncClient()
+
+    pool = AsyncClientPool(size=size, health_check_interval=0)
+    pool._connect = connect
+    return pool
+
+
+def test_discard_wakes_waiter():
+    pool = sync_pool()
+    client = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(5)))
+    waiter.start()
+
+    pool._discard(client)
+    waiter.join(5)
+
+    assert acquired and acquired[0] is not client
+    assert pool._created == 1
+
+
+def test_stale_client_replaced():
+    pool = sync_pool()
+    stale = pool.acquire()
+    pool.release(stale)
+    stale.connected = False
+
+    client = pool.acquire()
+
+    assert client is not stale
+    assert stale.closed
+    assert pool._created == 1
+
+
+def test_acquire_times_out():
+    pool = sync_pool()
+    pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(0.05)
+
+
+def test_async_discard_wakes_waiter():
+    async def run():
+        pool = async_pool()
+        client = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire(5))
+        await asyncio.sleep(0)
+
+        await pool._discard(client)
+        acquired = await asyncio.wait_for(waiter, 5)
+
+        assert acquired is not client
+        assert pool._created == 1
+
+    asyncio.run(run())
+
+
+def test_async_stale_client_replaced():
+    async def run():
+        pool = async_pool()
+        stale = await pool.acquire()
+        await pool.release(stale)
+        stale.connected = False
+
+        client = await pool.acquire()
+
+        assert client is not stale
+        assert stale.closed
+        assert pool._created == 1
+
+    asyncio.run(run())
+
+
+def test_async_acquire_times_out():
+    async def run():
+        pool = async_pool()
+        await pool.acquire()
+        with pytest.raises(TimeoutError):
+            await pool.acquire(0.05)
+        assert pool._created == 1
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+import asyncio
+
+from api.services.coalesce import SingleFlight
+
+
+def counting_producer(calls: list):
+    async def produce():
+        calls.append(1)
+        for chunk in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    return produce
+
+
+async def collect(chunks) -> list[str]:
+    return [chunk async for chunk in chunks]
+
+
+def test_identical_requests_share_one_generation():
+    async def run():
+        flights, calls = SingleFlight(), []
+        produce = counting_producer(calls)
+
+        async def ask():
+            flight = flights.join("key", produce)
+            return await collect(flights.subscribe("key", flight))
+
+        answers = await asyncio.gather(ask(), ask(), ask())
+
+        assert answers == [["a", "b", "c"]] * 3
+        assert len(calls) == 1
+        assert not flights.active("key")
+
+    asyncio.run(run())
+
+
+def test_seat_replays_landed_flight():
+    async def run():
+        flights = SingleFlight()
+        flight = flights.join("key", counting_producer([]))
+        seat = flights.reserve("key")
+
+        assert await collect(flights.subscribe("key", flight)) == ["a", "b", "c"]
+        assert not flights.active("key")
+        assert await collect(flights.listen(seat)) == ["a", "b", "c"]
+        assert seat.released
+
+    asyncio.run(run())
+
+
+def test_unused_seat_cancels_flight():
+    async def run():
+        flights = SingleFlight()
+        flight = flights.join("key", counting_producer([]))
+        seat = flights.reserve("key")
+
+        seat.release()
+        seat.release()
+        await asyncio.sleep(0)
+
+        assert flight.subscribers == 0
+        assert flight.task.cancelled()
+        assert not flights.active("key")
+
+    asyncio.run(run())
+
+
+def test_leader_ticket_released_when_flight_ends():
+    class Ticket:
+        detached = False
+        releases = 0
+
+        def release(self):
+            self.releases += 1
+
+    async def run():
+        flights = SingleFlight()
+        leader, follower = Ticket(), Ticket()
+        flight = flights.join("key", counting_producer([]), ticket=leader)
+        flights.join("key", counting_producer([]), ticket=follower)
+
+        assert leader.detached
+        assert follower.releases == 1
+        await collect(flights.subscribe("key", flight))
+        assert leader.releases == 1
+
+    asyncio.run(run())
+
+
+def test_no_seat_without_flight():
+    assert SingleFlight().reserve("key") is None
@@ -0,0 +1,35 @@
+from rag.query import pack_context
+from rag.tokens import approximate_tokens
+
+
+def test_repeated_sentences_dropped():
+    first = "The LHC is a 27-kilometre ring of superconducting magnets. It is at CERN."
+    second = (
+        "The LHC is a 27-kilometre ring of superconducting magnets. "
+        "Protons collide at four points."
+    )
+
+    packed = pack_context([first, second], budget=None)
+
+    assert packed == [first, "Protons collide at four points."]
+
+
+def test_budget_cuts_on_sentence_boundary():
+    chunks = [
+        "The LHC accelerates protons. They travel close to the speed of light.",
+        "ATLAS and CMS are general-purpose detectors.",
+    ]
+
+    budget = approximate_tokens("The LHC accelerates protons. ")
+    packed = pack_context(chunks, budget=budget)
+
+    assert packed == ["The LHC accelerates protons."]
+
+
+def test_oversized_first_sentence_truncated():
+    table = "| run | energy | " * 100
+
+    packed = pack_context([table, "ATLAS is a detector."], budget=10)
+
+    assert len(packed) == 1
+    assert packed[0] and table.startswith(packed[0])
@@ -0,0 +1,60 @@
+import time
+from array import array
+
+import pytest
+
+from rag.session import ConversationSession, MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemorySessionStore(max_entries=2, ttl=60)
+    else:
+        store = SQLiteSessionStore(
+            tmp_path / "sessions.db", evict_every=1, max_entries=2, ttl=60
+        )
+    yield store
+    store.close()
+
+
+def test_session_round_trip(store):
+    session = store.get("one")
+    session.add_turn("What is CERN?", "A laboratory.")
+    session.context = array("i", [1, 2, 3])
+    session.prompt_tokens = 42
+    store.save(session)
+
+    loaded = store.get("one")
+    assert loaded.history == session.history
+    assert list(loaded.context) == [1, 2, 3]
+    assert loaded.rendered == session.rendered
+    assert loaded.prompt_tokens == 42
+
+
+def test_unknown_session_is_new(store):
+    session = store.get("missing")
+    assert session.session_id == "missing"
+    assert session.history == []
+
+
+def test_expired_session_is_new(store):
+    store.save(ConversationSession("old", [{"username": "human", "text": "Hi"}]))
+    store.ttl = 0
+
+    assert store.get("old").history == []
+
+
+def test_least_recent_sessions_evicted(store):
+    for i, session_id in enumerate(("a", "b", "c")):
+        store.save(ConversationSession(session_id, updated_at=time.time() + i))
+
+    assert len(store) == 2
+    assert store.load("a") is None
+    assert store.load("c") is not None
+
+
+def test_deleted_session_is_gone(store):
+    store.save(ConversationSession("one"))
+    store.delete("one")
+    assert store.load("one") is None
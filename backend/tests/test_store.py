@@ -0,0 +1,56 @@
+import pytest
+
+from rag.store import RecordReader, RecordWriter, index_path, is_complete, write_records
+
+
+def key(record: dict) -> str | None:
+    return record.get("id")
+
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / "records.jsonl"
+    records = [{"id": "a", "text": "Ä"}, {"text": "no id"}, {"id": "b"}, {"id": "a"}]
+
+    assert write_records(path, records, key) == 4
+
+    reader = RecordReader(path)
+    assert list(reader) == records
+    assert len(reader) == 4
+    assert "b" in reader and "c" not in reader
+    assert reader.get("a") == {"id": "a"}
+    assert reader.get("c") is None
+
+
+def test_failed_write_keeps_previous_file(tmp_path):
+    path = tmp_path / "records.jsonl"
+    write_records(path, [{"id": "a"}], key)
+
+    with pytest.raises(ValueError):
+        with RecordWriter(path, key) as writer:
+            writer.write({"id": "b"})
+            raise ValueError("interrupted")
+
+    assert is_complete(path)
+    assert list(RecordReader(path)) == [{"id": "a"}]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "records.idx.json",
+        "records.jsonl",
+    ]
+
+
+def test_file_without_index_incomplete(tmp_path):
+    path = tmp_path / "records.jsonl"
+    write_records(path, [{"id": "a"}], key)
+    index_path(path).unlink()
+
+    assert not is_complete(path)
+
+
+def test_legacy_index_counts_records(tmp_path):
+    path = tmp_path / "records.jsonl"
+    write_records(path, [{"id": "a"}, {"id": "a"}], key)
+    index_path(path).write_text('{"a": 0}', encoding="utf-8")
+
+    reader = RecordReader(path)
+    assert len(reader) == 2
+    assert reader.get("a") == {"id": "a"}
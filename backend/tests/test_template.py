@@ -0,0 +1,17 @@
+from rag.template import build_followup_prompt, build_prompt
+
+
+def test_build_prompt():
+    prompt = build_prompt(
+        "What is CERN?",
+        "CERN is a laboratory near Geneva.",
+        history=[{"username": "user", "text": "Hello"}],
+    ).to_string()
+    assert "What is CERN?" in prompt
+    assert "CERN is a laboratory near Geneva." in prompt
+
+
+def test_build_followup_prompt():
+    prompt = build_followup_prompt("And the LHC?", "The LHC is a collider.")
+    assert "And the LHC?" in prompt
+    assert "The LHC is a collider." in prompt
@@ -11,6 +11,8 @@ function Chat() {
   const [message, setMessage] = useState("");
   const [isBotTyping, setIsBotTyping] = useState(false);
   const messagesEndRef = useRef(null);
+  // The server keeps the conversation, we only send the id it gave us
+  const sessionId = useRef<string | null>(null);
 
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -37,8 +39,14 @@ function Chat() {
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ question: message, history: messages }),
+      body: JSON.stringify(
+        sessionId.current
+          ? { question: message, session_id: sessionId.current }
+          : { question: message, start_session: true }
+      ),
     }).then((response) => {
+      sessionId.current =
+        response.headers.get("X-Session-Id") ?? sessionId.current;
       const reader = response.body.getReader();
       const decoder = new TextDecoder("utf-8", { fatal: true });
 